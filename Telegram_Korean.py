@@ -1,68 +1,122 @@
 import asyncio
+import html
 import random
-from aiogram import Dispatcher, F, Bot
-from aiogram.filters import CommandStart
+import re
+from aiogram import Dispatcher, F
+from aiogram.filters import CommandStart, Command
 from aiogram.types import Message, KeyboardButton, ReplyKeyboardMarkup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.client.default import DefaultBotProperties
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from mistralai import Mistral
-from datetime import datetime
-from db import Database
 import logging
 logging.basicConfig(level=logging.INFO)
 
 import sqlite3
 
-from scheduler import schedule_daily_word, schedule_daily_quiz
+# Одна база (один поток-писатель) и общие хранилища на процесс — те же, что у рассылок
+from scheduler import schedule_daily_word, schedule_daily_quiz, resume_broadcasts, db, quiz_store, srs
 
 
 
-from configuration import BOT_TOKEN, API_KEY, MODEL_NAME, MAX_REQUESTS_PER_DAY, user_requests, ADMIN_ID
+from configuration import ADMIN_ID, AI_CACHE_HITS_COUNT_AGAINST_LIMIT
+from configuration import STREAM_REPLIES, STREAM_EDIT_INTERVAL, DEFAULT_TIMEZONE
+from configuration import METRICS_HOST, METRICS_PORT
+from ai_gateway import create_ai_gateway
+from ai_cache import ResponseCache
+from quota import create_quota_store
+from quiz_store import QUIZ_CALLBACK_PREFIX, decode_answer
+from fsm_storage import SQLiteStorage
+from outbound import bot
+from metrics import MetricsMiddleware, start_metrics_server
 
 
 
 # Функция для взаимодействия с Mistral AI
 async def get_ai_response(content, prompt):
     try:
-        client = Mistral(api_key=API_KEY)
-
-        response = await client.chat.stream_async(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": content},
-            ],
-        )
-        result = ""
-        async for chunk in response:
-            delta_content = chunk.data.choices[0].delta.content
-            if delta_content:
-                result += delta_content
+        result = await ai.complete(content, prompt)
+        if result:
+            await response_cache.set(content, prompt, result)
         return result or "Ошибка: Пустой ответ от модели."
     except Exception as e:
         return f"Произошла ошибка: {e}"
 
-# Создаем экземпляры бота и диспетчера ,session=session
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-dp = Dispatcher()
-db = Database('korean_bot.db')
-
+# Окончательный ответ в HTML; если разметка модели некорректна — без разметки.
+# При flood control ждём и пробуем ещё раз, иначе в сообщении останется незаконченный текст
+async def edit_reply(target: Message, text):
+    for attempt in range(2):
+        try:
+            try:
+                await target.edit_text(text[:4096])
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    return
+                await target.edit_text(strip_html(text)[:4096], parse_mode=None)
+            return
+        except TelegramRetryAfter as e:
+            if attempt:
+                raise
+            await asyncio.sleep(e.retry_after)
+
+
+def strip_html(text):
+    # Убирает теги, включая недописанный тег в конце текста
+    return re.sub(r"<[^>]*(>|$)", "", text)
+
+
+# Потоковый ответ: сообщение редактируется по мере генерации не чаще STREAM_EDIT_INTERVAL
+async def stream_ai_response(content, prompt, target: Message):
+    loop = asyncio.get_running_loop()
+    result = ""
+    shown = ""
+    # Первый фрагмент показываем сразу, интервал выдерживается только между правками
+    last_edit = None
+    try:
+        async for chunk in ai.stream(content, prompt):
+            result += chunk
+            if last_edit is not None and loop.time() - last_edit < STREAM_EDIT_INTERVAL:
+                continue
+            # Промежуточный текст без разметки: теги могут быть ещё не закрыты
+            preview = strip_html(result)[:4094] + " ▌"
+            if preview.strip(" ▌") and preview != shown:
+                # Ошибка промежуточной правки не прерывает ответ: пропускаем этот кадр
+                try:
+                    await target.edit_text(preview, parse_mode=None)
+                    shown = preview
+                    last_edit = loop.time()
+                except TelegramRetryAfter as e:
+                    last_edit = loop.time() + e.retry_after
+                except TelegramAPIError:
+                    last_edit = loop.time()
+    # Сюда попадают только ошибки модели
+    except Exception as e:
+        await edit_reply(target, f"Произошла ошибка: {html.escape(str(e))}")
+        return
 
+    if not result:
+        await edit_reply(target, "Ошибка: Пустой ответ от модели.")
+        return
+    await response_cache.set(content, prompt, result)
+    await edit_reply(target, result)
 
-# Проверка лимита запросов
-def check_request_limit(user_id):
-    today = datetime.now().date()
+# Создаем диспетчер; бот общий с рассылками (outbound.py)
+# Состояния диалогов хранятся в SQLite: переживают перезапуск и общие для всех процессов
+fsm_storage = SQLiteStorage(db)
+# Dispatcher сам вызывает fsm_storage.close() при остановке
+dp = Dispatcher(storage=fsm_storage)
+# Время и ошибки обработчиков для /metrics
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
+quota = create_quota_store(db)
+ai = create_ai_gateway()
+response_cache = ResponseCache(db)
 
-    if user_id not in user_requests:
-        user_requests[user_id] = {"count": 0, "date": today}
 
-    # Если дата изменилась, сбрасываем счётчик запросов
-    if user_requests[user_id]["date"] != today:
-        user_requests[user_id] = {"count": 0, "date": today}
 
-    remaining_requests = MAX_REQUESTS_PER_DAY - user_requests[user_id]["count"]
+# Проверка лимита запросов
+async def check_request_limit(user_id):
+    remaining_requests = await quota.remaining(user_id)
 
     if remaining_requests <= 0:
         return "Лимит запросов на сегодня исчерпан.\n\n Попробуйте снова завтра. 👋🏻", False
@@ -73,10 +127,9 @@ def check_request_limit(user_id):
     )
 
 
-# Обновление счётчика запросов
-def update_request_count(user_id):
-    if user_id in user_requests:
-        user_requests[user_id]["count"] += 1
+# Обновление счётчика запросов (атомарно: False, если лимит уже исчерпан)
+async def update_request_count(user_id):
+    return await quota.acquire(user_id)
 
 
 # Создаем главное меню
@@ -118,16 +171,17 @@ class AdminReplyState(StatesGroup):
 @dp.message(CommandStart())
 async def start_command(message: Message):
     if message.chat.type == 'private':
-        if not db.user_exists(message.from_user.id):
-            db.add_user(message.from_user.id)
+        if not await db.user_exists(message.from_user.id):
+            await db.add_user(message.from_user.id)
         await message.answer(
         "안녕하세요!\n\nМеня зовут <b>Lingvo</b>, и я ваш помощник в изучении корейского языка.\n\n"
         "Я помогу вам:\n"
         "• Проверить орфографию корейских текстов\n"
-        "• Изучать новые слова каждый день (рассылка в 9:00 по МСК)\n"
-        "• Проходить квизы для закрепления знаний (рассылка в 19:00 по МСК)\n"
+        "• Изучать новые слова каждый день (рассылка в 9:00 по вашему времени)\n"
+        "• Проходить квизы для закрепления знаний (рассылка в 19:00 по вашему времени)\n"
         "• Готовиться к экзамену TOPIK\n\n"
-        "Рассылка происходит каждый день автоматически.\n\n"
+        "Рассылка происходит каждый день автоматически. По умолчанию время московское, "
+        "изменить часовой пояс можно командой /timezone.\n\n"
         "<b>Выберите нужный пункт меню, чтобы начать:</b>",
         reply_markup=create_reply_menu(),
     )
@@ -155,32 +209,53 @@ async def handle_spell_check(message: Message, state: FSMContext):
               "Ты умеешь исправлять ошибки только на корейском языке.")
 
     await state.clear()
-    await handle_request(message, prompt)
-    await processing_message.delete()
+    # Если ответ показан в сообщении «обрабатывается», оставляем его
+    if not await handle_request(message, prompt, processing_message):
+        await processing_message.delete()
 
 
-# Общий обработчик запросов
-async def handle_request(message: Message, prompt):
+# Общий обработчик запросов; возвращает True, если ответ записан в processing_message
+async def handle_request(message: Message, prompt, processing_message: Message = None):
     user_id = message.from_user.id
-    limit_message, within_limit = check_request_limit(user_id)
-
-    if not within_limit:
-        await message.answer(limit_message)
-        return
-
-    if len(message.text) > 200:
-        await message.answer("Ваше сообщение слишком длинное! Пожалуйста, сократите текст до 200 символов.")
-        return
-
-    # Обновляем счётчик перед отправкой запроса к модели
-    update_request_count(user_id)
-
-    response = await get_ai_response(message.text, prompt)
-    await message.answer(response, reply_markup=create_reply_menu())
+    cached_response = await response_cache.get(message.text, prompt)
+    # Ответ из кэша можно выдать, не расходуя лимит запросов
+    free_answer = cached_response is not None and not AI_CACHE_HITS_COUNT_AGAINST_LIMIT
+
+    if not free_answer:
+        limit_message, within_limit = await check_request_limit(user_id)
+
+        if not within_limit:
+            await message.answer(limit_message)
+            return False
+
+        if len(message.text) > 200:
+            await message.answer("Ваше сообщение слишком длинное! Пожалуйста, сократите текст до 200 символов.")
+            return False
+
+        # Обновляем счётчик перед отправкой запроса к модели
+        if not await update_request_count(user_id):
+            limit_message, _ = await check_request_limit(user_id)
+            await message.answer(limit_message)
+            return False
+
+    streamed = STREAM_REPLIES and processing_message is not None
+    if streamed:
+        # Показываем ответ по мере генерации в сообщении «обрабатывается»
+        if cached_response is not None:
+            await edit_reply(processing_message, cached_response)
+        else:
+            await stream_ai_response(message.text, prompt, processing_message)
+    else:
+        if cached_response is not None:
+            response = cached_response
+        else:
+            response = await get_ai_response(message.text, prompt)
+        await message.answer(response, reply_markup=create_reply_menu())
 
     # После ответа больше не обновляем счётчик
-    limit_message, _ = check_request_limit(user_id)
+    limit_message, _ = await check_request_limit(user_id)
     await message.answer(limit_message, reply_markup=create_reply_menu())
+    return streamed
 
 
 @dp.message(F.text == "Подготовка TOPIK")
@@ -198,9 +273,9 @@ async def essay_plan(message: Message):
 async def update_subscription_status(user_id, action):
     try:
         if action == "unsubscribe":
-            db.delete_user(user_id)
+            await db.delete_user(user_id)
         elif action == "resubscribe":
-            db.add_user(user_id)
+            await db.add_user(user_id)
         return True
     except sqlite3.Error as e:
         print(f"Ошибка при работе с базой данных: {e}")
@@ -239,39 +314,38 @@ async def resubscribe_topik(callback: CallbackQuery):
     await callback.answer()
 
 # Обработчик ответов на квиз
-@dp.callback_query(F.data.startswith("quiz_"))
+@dp.callback_query(F.data.startswith(QUIZ_CALLBACK_PREFIX))
 async def handle_quiz_answer(callback: CallbackQuery):
-    # Формат callback_data: quiz_{user_id}_{correct_index}_{selected_index}_{correct_word}
-    parts = callback.data.split("_")
-    if len(parts) != 5:
+    # Формат callback_data: q:{base64(quiz_id, selected_index)}
+    answer = decode_answer(callback.data)
+    quiz = await quiz_store.get(answer[0]) if answer else None
+    if quiz is None:
         await callback.answer("Ошибка обработки ответа")
         return
     
-    user_id = int(parts[1])
-    correct_index = int(parts[2])
-    selected_index = int(parts[3])
-    correct_word = parts[4]
-    
-    # Получаем original_sentence из базы данных
-    active_quiz = db.get_active_quiz(user_id)
-    if active_quiz and active_quiz['correct_word'] == correct_word:
-        original_sentence = active_quiz['original_sentence']
-    else:
-        original_sentence = ""  # Fallback если не найдено
+    user_id = callback.from_user.id
+    selected_index = answer[1]
+    correct_index = quiz['correct_index']
+    correct_word = quiz['correct_word']
+    original_sentence = quiz['original_sentence']
     
-    # Проверяем, что ответил правильный пользователь
-    if callback.from_user.id != user_id:
+    # Проверяем, что ответил получатель квиза
+    if callback.message and callback.message.chat.id != user_id:
         await callback.answer("Это не ваш квиз!", show_alert=True)
         return
     
+    # Засчитываем только первый ответ на последний присланный квиз (повторное нажатие ничего не меняет)
+    if not await db.claim_active_quiz(user_id, answer[0]):
+        await callback.answer("Ответ на этот квиз уже засчитан")
+        return
+    
     # Проверяем правильность ответа
     is_correct = (selected_index == correct_index)
     
     # Сохраняем статистику в базу данных
-    db.record_quiz_answer(user_id, is_correct, correct_word)
-    
-    # Удаляем активный квиз после ответа
-    db.delete_active_quiz(user_id)
+    await db.record_quiz_answer(user_id, is_correct, correct_word)
+    # Переносим следующее повторение слова по SM-2
+    await srs.record_answer(user_id, correct_word, is_correct)
     
     if is_correct:
         # Правильный ответ
@@ -288,8 +362,7 @@ async def handle_quiz_answer(callback: CallbackQuery):
         await callback.answer("Верно! 🎉")
     else:
         # Неправильный ответ
-        # Получаем правильный вариант из кнопок
-        correct_option = callback.message.reply_markup.inline_keyboard[correct_index][0].text
+        correct_option = quiz['options'][correct_index]
         
         # Одобряющие фразы при неправильном ответе
         encouraging_phrases = [
@@ -315,6 +388,12 @@ async def handle_quiz_answer(callback: CallbackQuery):
         await callback.answer("Неправильно 😔", show_alert=True)
 
 
+# Квизы, отправленные до перехода на компактный формат кнопок
+@dp.callback_query(F.data.startswith("quiz_"))
+async def handle_legacy_quiz_answer(callback: CallbackQuery):
+    await callback.answer("Этот квиз устарел. Дождитесь следующего квиза в 19:00!", show_alert=True)
+
+
 # Обработчики для кнопки "Обратная связь 🧡"
 @dp.message(F.text == "Обратная связь 🧡")
 async def feedback_menu(message: Message):
@@ -367,18 +446,62 @@ async def ask_admin_reply(callback: CallbackQuery, state: FSMContext):
 @dp.message(F.text == "Моя статистика 📊")
 async def show_stats(message: Message):
     user_id = message.from_user.id
-    today_stats = db.get_user_stats(user_id)
-    all_time_stats = db.get_user_all_time_stats(user_id)
+    all_time_stats = await db.get_user_all_time_stats(user_id)
     
     stats_text = (
         f"<b>За все время:</b>\n"
         f"✅ Правильных: {all_time_stats['correct']}\n"
         f"📝 Всего ответов: {all_time_stats['total']}\n"
-        f"🎯 Точность: {all_time_stats['accuracy']}%"
+        f"🎯 Точность: {all_time_stats['accuracy']}%\n"
+        f"🔥 Дней подряд: {all_time_stats['streak']} (рекорд: {all_time_stats['best_streak']})"
     )
     
     await message.answer(stats_text, reply_markup=create_reply_menu(), parse_mode="HTML")
 
+# Часовые пояса для выбора в /timezone: (подпись, имя IANA)
+TIMEZONES = [
+    ("Калининград (МСК−1)", "Europe/Kaliningrad"),
+    ("Москва (МСК)", "Europe/Moscow"),
+    ("Самара (МСК+1)", "Europe/Samara"),
+    ("Екатеринбург (МСК+2)", "Asia/Yekaterinburg"),
+    ("Омск (МСК+3)", "Asia/Omsk"),
+    ("Новосибирск (МСК+4)", "Asia/Novosibirsk"),
+    ("Иркутск (МСК+5)", "Asia/Irkutsk"),
+    ("Якутск (МСК+6)", "Asia/Yakutsk"),
+    ("Владивосток (МСК+7)", "Asia/Vladivostok"),
+    ("Алматы", "Asia/Almaty"),
+    ("Ташкент", "Asia/Tashkent"),
+    ("Сеул", "Asia/Seoul"),
+]
+TIMEZONE_LABELS = dict((tz, label) for label, tz in TIMEZONES)
+
+
+# Команда /timezone — выбор часового пояса для рассылок
+@dp.message(Command("timezone"))
+async def choose_timezone(message: Message):
+    current = await db.get_user_timezone(message.from_user.id) or DEFAULT_TIMEZONE
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=("✅ " if tz == current else "") + label, callback_data=f"tz:{tz}")]
+        for label, tz in TIMEZONES
+    ])
+    await message.answer(
+        f"Сейчас рассылки приходят по времени: <b>{TIMEZONE_LABELS.get(current, current)}</b>.\n\n"
+        "Выберите свой часовой пояс — слово дня будет приходить в 9:00, а квиз в 19:00 по местному времени:",
+        reply_markup=keyboard
+    )
+
+
+@dp.callback_query(F.data.startswith("tz:"))
+async def set_timezone(callback: CallbackQuery):
+    tz = callback.data[len("tz:"):]
+    if tz not in TIMEZONE_LABELS:
+        await callback.answer("Неизвестный часовой пояс", show_alert=True)
+        return
+    await db.set_user_timezone(callback.from_user.id, tz)
+    await callback.message.edit_text(f"🕘 Часовой пояс сохранен: <b>{TIMEZONE_LABELS[tz]}</b>")
+    await callback.answer()
+
+
 @dp.message(AdminReplyState.waiting_for_reply)
 async def send_admin_reply(message: Message, state: FSMContext):
     data = await state.get_data()
@@ -432,6 +555,19 @@ async def subscribe_channel(message: Message):
         disable_web_page_preview=True
     )
 
+# Статистика кэша ответов ИИ (только для администратора)
+@dp.message(Command("cache_stats"), F.from_user.id == ADMIN_ID)
+async def cache_stats(message: Message):
+    stats = response_cache.stats()
+    await message.answer(
+        f"<b>Кэш ответов ИИ:</b>\n"
+        f"Попаданий в памяти: {stats['memory_hits']}\n"
+        f"Попаданий в БД: {stats['db_hits']}\n"
+        f"Промахов: {stats['misses']}\n"
+        f"Доля попаданий: {stats['hit_rate']}%\n"
+        f"Записей в памяти: {stats['size']}"
+    )
+
 # Обработчик для сообщений вне меню
 @dp.message()
 async def handle_unknown_message(message: Message):
@@ -440,8 +576,7 @@ async def handle_unknown_message(message: Message):
 
 
 
-async def main():
-    print("Бот запущен!")
+def start_scheduler():
     # Создаем один планировщик для всех задач
     from apscheduler.schedulers.asyncio import AsyncIOScheduler
     scheduler = AsyncIOScheduler()
@@ -451,12 +586,22 @@ async def main():
     
     # Планируем отправку квиза в 19:00 (значение по умолчанию)
     schedule_daily_quiz(scheduler=scheduler, test_mode=False)
+
+    # Сразу после запуска продолжаем рассылки, прерванные перезапуском
+    scheduler.add_job(resume_broadcasts)
     
     # Запускаем планировщик
     scheduler.start()
+    return scheduler
+
+
+async def main():
+    print("Бот запущен!")
+    start_scheduler()
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
     
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
-
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import time
+import unicodedata
+from collections import OrderedDict
+
+from configuration import MODEL_NAME, AI_CACHE_SIZE, AI_CACHE_TTL
+from metrics import AI_CACHE_LOOKUPS
+
+
+def normalize_text(text):
+    """Приводит текст к единому виду: NFC и одиночные пробелы"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class ResponseCache:
+    """Кэш ответов ИИ: LRU в памяти с временем жизни и таблица SQLite за ним.
+
+    Ключ — хэш нормализованного текста, системного промпта и модели,
+    поэтому одинаковые запросы получают ответ без обращения к модели.
+    """
+
+    def __init__(self, db, max_size=AI_CACHE_SIZE, ttl=AI_CACHE_TTL, model=MODEL_NAME):
+        self.db = db
+        self.max_size = max_size
+        self.ttl = ttl
+        self.model = model
+        self.entries = OrderedDict()  # ключ -> (время создания, ответ)
+        self.next_purge = 0.0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def make_key(self, text, prompt):
+        payload = json.dumps([normalize_text(text), prompt, self.model], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, created_at, response):
+        self.entries[key] = (created_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def get(self, text, prompt):
+        key = self.make_key(text, prompt)
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry and entry[0] > now - self.ttl:
+            self.entries.move_to_end(key)
+            self.memory_hits += 1
+            AI_CACHE_LOOKUPS.labels("memory_hit").inc()
+            return entry[1]
+        self.entries.pop(key, None)
+
+        row = await self.db.get_cached_response(key, now - self.ttl)
+        if row:
+            self._remember(key, row[1], row[0])
+            self.db_hits += 1
+            AI_CACHE_LOOKUPS.labels("db_hit").inc()
+            return row[0]
+        self.misses += 1
+        AI_CACHE_LOOKUPS.labels("miss").inc()
+        return None
+
+    async def set(self, text, prompt, response):
+        key = self.make_key(text, prompt)
+        now = time.time()
+        self._remember(key, now, response)
+        await self.db.save_cached_response(key, response, now)
+        if now > self.next_purge:
+            self.next_purge = now + self.ttl
+            await self.db.purge_cached_responses(now - self.ttl)
+
+    def stats(self):
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups * 100, 1) if lookups else 0.0,
+            "size": len(self.entries),
+        }
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+from mistralai import Mistral
+from mistralai.models import SDKError
+
+from configuration import API_KEY, MODEL_NAME, AI_BACKEND, AI_MAX_IN_FLIGHT, AI_TIMEOUT, AI_MAX_RETRIES
+from configuration import MISTRAL_SERVER_URL
+from metrics import AI_IN_FLIGHT, AI_REQUEST_DURATION, AI_FIRST_TOKEN, AI_RETRIES
+
+
+class MistralBackend:
+    """Mistral AI с одним долгоживущим клиентом и пулом HTTP-соединений"""
+
+    def __init__(self, api_key=API_KEY, model=MODEL_NAME, max_connections=AI_MAX_IN_FLIGHT,
+                 server_url=MISTRAL_SERVER_URL):
+        self.model = model
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(AI_TIMEOUT, connect=10),
+        )
+        self.client = Mistral(api_key=api_key, server_url=server_url or None, async_client=http_client)
+
+    async def stream(self, messages):
+        response = await self.client.chat.stream_async(model=self.model, messages=messages)
+        async for chunk in response:
+            delta_content = chunk.data.choices[0].delta.content
+            if delta_content:
+                yield delta_content
+
+
+class MockBackend:
+    """Имитация модели для замеров без обращения к API"""
+
+    def __init__(self, first_token_delay=0.3, token_delay=0.02, tokens=40, error_rate=0.0):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+
+    async def stream(self, messages):
+        await asyncio.sleep(self.first_token_delay)
+        if random.random() < self.error_rate:
+            raise httpx.ConnectError("mock: соединение сброшено")
+        text = messages[-1]["content"]
+        for i in range(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield f"{text[i % len(text)] if text else '가'}"
+
+
+def is_transient(error):
+    """Ошибки, после которых запрос имеет смысл повторить"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, SDKError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+class AIGateway:
+    """Единая точка обращения к модели.
+
+    Ограничивает число одновременных запросов, прерывает запросы по таймауту
+    и повторяет их при временных ошибках (пока пользователю не отдан первый фрагмент).
+    """
+
+    def __init__(self, backend, max_in_flight=AI_MAX_IN_FLIGHT, timeout=AI_TIMEOUT, retries=AI_MAX_RETRIES):
+        self.backend = backend
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.timeout = timeout
+        self.retries = retries
+
+    async def stream(self, content, prompt):
+        """Возвращает ответ модели по мере генерации"""
+        messages = [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": content},
+        ]
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            async with self.semaphore:
+                deadline = loop.time() + self.timeout
+                chunks = self.backend.stream(messages)
+                started = time.perf_counter()
+                result = "error"
+                AI_IN_FLIGHT.inc()
+                try:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                    except StopAsyncIteration:
+                        result = "ok"
+                        return
+                    except Exception as e:
+                        if attempt == self.retries or not is_transient(e):
+                            raise
+                        result = "retry"
+                        AI_RETRIES.inc()
+                        logging.warning(f"⚠️ Временная ошибка ИИ (попытка {attempt + 1}): {e!r}")
+                    else:
+                        AI_FIRST_TOKEN.observe(time.perf_counter() - started)
+                        while True:
+                            yield chunk
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), max(deadline - loop.time(), 0))
+                            except StopAsyncIteration:
+                                result = "ok"
+                                return
+                finally:
+                    AI_IN_FLIGHT.dec()
+                    AI_REQUEST_DURATION.labels(result).observe(time.perf_counter() - started)
+                    await chunks.aclose()
+            await asyncio.sleep(min(2 ** attempt, 10))
+
+    async def complete(self, content, prompt):
+        """Возвращает ответ модели целиком"""
+        return "".join([chunk async for chunk in self.stream(content, prompt)])
+
+
+def create_ai_gateway():
+    backend = MockBackend() if AI_BACKEND == "mock" else MistralBackend()
+    return AIGateway(backend)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from configuration import ASSETS_DIR, ASSET_MAX_SIZE, ASSET_JPEG_QUALITY
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def convert_image(source, target, max_size, quality):
+    """Уменьшает изображение до max_size по большей стороне и сохраняет в JPEG.
+
+    Выполняется в отдельном процессе; возвращает (ширина, высота, хэш результата).
+    """
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # В JPEG нет прозрачности — кладем изображение на белый фон
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        temporary = target + ".tmp"
+        image.save(temporary, "JPEG", quality=quality, optimize=True, progressive=True)
+        size = image.size
+    os.replace(temporary, target)
+    return size[0], size[1], file_hash(target)
+
+
+def asset_name(source):
+    """Имя подготовленного файла: путь источника без каталогов, с расширением .jpg"""
+    stem = os.path.splitext(os.path.normpath(source))[0]
+    return stem.replace(os.sep, "_").lstrip("._") + ".jpg"
+
+
+def load_manifest(assets_dir=ASSETS_DIR):
+    try:
+        with open(os.path.join(assets_dir, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def build_assets(sources, assets_dir=ASSETS_DIR, max_size=ASSET_MAX_SIZE, quality=ASSET_JPEG_QUALITY,
+                 workers=None, force=False):
+    """Готовит изображения для отправки в Telegram и записывает манифест.
+
+    Пересобираются только изображения, у которых изменился исходный файл
+    или настройки сборки; остальные берутся из прежнего манифеста.
+    Возвращает (манифест, число пересобранных изображений).
+    """
+    os.makedirs(assets_dir, exist_ok=True)
+    settings = {"max_size": max_size, "quality": quality}
+    previous = load_manifest(assets_dir)
+    reuse = not force and previous.get("settings") == settings
+    old_images = previous.get("images", {}) if reuse else {}
+
+    images, jobs = {}, {}
+    for source in sorted(set(sources)):
+        if not os.path.isfile(source):
+            logging.warning(f"⚠️ Нет исходного изображения {source}")
+            continue
+        source_hash = file_hash(source)
+        target = os.path.join(assets_dir, asset_name(source))
+        entry = old_images.get(source)
+        if entry and entry["source_hash"] == source_hash and os.path.isfile(entry["path"]):
+            images[source] = entry
+        else:
+            jobs[source] = (source_hash, target)
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                source: executor.submit(convert_image, source, target, max_size, quality)
+                for source, (_, target) in jobs.items()
+            }
+            for source, future in futures.items():
+                source_hash, target = jobs[source]
+                try:
+                    width, height, asset_hash = future.result()
+                except Exception as e:
+                    logging.error(f"❌ Не удалось подготовить {source}: {e}")
+                    continue
+                images[source] = {
+                    "path": target,
+                    "source_hash": source_hash,
+                    "hash": asset_hash,
+                    "width": width,
+                    "height": height,
+                    "bytes": os.path.getsize(target),
+                    "source_bytes": os.path.getsize(source),
+                }
+
+    # Удаляем файлы, которые больше не упоминаются в манифесте
+    kept = {os.path.basename(entry["path"]) for entry in images.values()}
+    for name in os.listdir(assets_dir):
+        if name.endswith(".jpg") and name not in kept:
+            os.remove(os.path.join(assets_dir, name))
+
+    manifest = {"settings": settings, "images": images}
+    temporary = os.path.join(assets_dir, MANIFEST_NAME + ".tmp")
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(temporary, os.path.join(assets_dir, MANIFEST_NAME))
+    return manifest, len(jobs)
+
+
+class AssetManifest:
+    """Соответствие исходных изображений подготовленным файлам из манифеста.
+
+    Если изображение не собрано или файл пропал, используется исходный файл.
+    """
+
+    def __init__(self, assets_dir=ASSETS_DIR):
+        self.path = os.path.join(assets_dir, MANIFEST_NAME)
+        self.images = {}
+
+    def load(self, raw):
+        try:
+            self.images = json.loads(raw).get("images", {})
+        except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+            logging.error(f"❌ Ошибка чтения {self.path}: {e}")
+            self.images = {}
+
+    def resolve(self, image_path):
+        entry = self.images.get(image_path)
+        if entry and os.path.isfile(entry["path"]):
+            return entry["path"]
+        return image_path
@@ -0,0 +1,14 @@
+"""Общее для скриптов замеров: корень репозитория в sys.path, окружение для configuration.py и перцентили"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+# configuration.py требует ADMIN_ID, а замерам администратор не нужен
+os.environ.setdefault("ADMIN_ID", "0")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
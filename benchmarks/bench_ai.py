@@ -0,0 +1,65 @@
+"""Пропускная способность и хвостовые задержки AIGateway на имитации модели.
+
+Запускает --requests запросов проверки орфографии с --concurrency одновременными
+пользователями через MockBackend для нескольких значений max_in_flight.
+
+    python benchmarks/bench_ai.py --requests 500 --concurrency 100 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from _common import percentile
+
+from ai_gateway import AIGateway, MockBackend
+
+
+async def run(max_in_flight, args):
+    backend = MockBackend(args.first_token_delay, args.token_delay, args.tokens, args.error_rate)
+    gateway = AIGateway(backend, max_in_flight=max_in_flight, timeout=args.timeout, retries=2)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, first_tokens, failures = [], [], 0
+
+    async def request(i):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in gateway.stream(f"저는 학생이에요 {i}", "prompt"):
+                    if first is None:
+                        first = time.perf_counter() - started
+            except Exception:
+                failures += 1
+                return
+            latencies.append(time.perf_counter() - started)
+            first_tokens.append(first or 0.0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    print(
+        f"max_in_flight={max_in_flight:<4} {args.requests / elapsed:7.1f} req/s  "
+        f"latency p50 {statistics.median(latencies):6.2f} s  p99 {percentile(latencies, 0.99):6.2f} s  "
+        f"first token p50 {statistics.median(first_tokens):5.2f} s  failures {failures}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[4, 16, 64])
+    args = parser.parse_args()
+    for max_in_flight in args.in_flight:
+        await run(max_in_flight, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
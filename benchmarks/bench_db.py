@@ -0,0 +1,93 @@
+"""Задержка обработчиков квиза при одновременных ответах.
+
+Сравнивает синхронный Database (запросы прямо в event loop) и AsyncDatabase
+(запросы в отдельном потоке). Каждый «callback» делает то же, что
+handle_quiz_answer: get_quiz_instance, claim_active_quiz, record_quiz_answer.
+Параллельно тикер измеряет, насколько event loop опаздывает с пробуждением —
+это задержка, которую видят все остальные пользователи бота.
+
+    python benchmarks/bench_db.py --users 10000 --callbacks 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from _common import percentile
+
+from db import Database, AsyncDatabase
+
+
+def prepare(path, users):
+    db = Database(path)
+    with db.connection:
+        db.cursor.executemany("INSERT INTO users (user_id) VALUES (?)", ((i,) for i in range(users)))
+    quiz_id = db.create_quiz_instance("학교", "저는 매일 학교에 가요.", ["학교", "병원", "시장", "공원"], 0)
+    db.save_active_quizzes([(i, quiz_id) for i in range(users)])
+    db.close()
+    return quiz_id
+
+
+async def measure(db, quiz_id, callbacks, concurrency, users, is_async):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    lags = []
+    done = asyncio.Event()
+
+    async def call(method, *args):
+        result = getattr(db, method)(*args)
+        return await result if is_async else result
+
+    async def handler(user_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await call("get_quiz_instance", quiz_id)
+            await call("claim_active_quiz", user_id, quiz_id)
+            await call("record_quiz_answer", user_id, user_id % 2 == 0, "학교")
+            latencies.append(time.perf_counter() - started)
+
+    async def ticker():
+        while not done.is_set():
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(i % users) for i in range(callbacks)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return elapsed, latencies, lags
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--callbacks", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, is_async in (("Database (sync)", False), ("AsyncDatabase", True)):
+            path = os.path.join(tmp, f"{is_async}.db")
+            quiz_id = prepare(path, args.users)
+            db = AsyncDatabase(path) if is_async else Database(path)
+            elapsed, latencies, lags = await measure(db, quiz_id, args.callbacks, args.concurrency, args.users, is_async)
+            if is_async:
+                await db.close()
+            else:
+                db.close()
+            print(
+                f"{name:16} {args.callbacks / elapsed:8.0f} callbacks/s  "
+                f"latency p50 {statistics.median(latencies) * 1000:6.2f} ms  "
+                f"p99 {percentile(latencies, 0.99) * 1000:6.2f} ms  "
+                f"loop lag p99 {percentile(lags, 0.99) * 1000:6.2f} ms  "
+                f"max {max(lags) * 1000:6.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
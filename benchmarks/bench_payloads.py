@@ -0,0 +1,76 @@
+"""Стоимость подготовки сообщения квиза на одного получателя.
+
+«До» — текст и клавиатура собираются заново для каждого пользователя (как
+было в send_quiz), «после» — используется готовый QuizPayload. В обоих
+случаях создаётся объект метода SendMessage, как это делает bot.send_message.
+
+    python benchmarks/bench_payloads.py --recipients 20000
+"""
+import argparse
+import time
+import tracemalloc
+
+import _common  # noqa: F401
+
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from payloads import QuizPayload
+
+QUIZ = {
+    "sentence": "저는 매일 ______에 가요.",
+    "translation": "школа",
+    "options": ["병원", "학교", "시장", "공원"],
+    "correct_index": 1,
+    "correct_word": "학교",
+}
+
+
+def per_user(user_id):
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=option,
+            callback_data=f"quiz_{user_id}_{QUIZ['correct_index']}_{i}_{QUIZ['correct_word']}"
+        )]
+        for i, option in enumerate(QUIZ["options"])
+    ])
+    message_text = (
+        f"<b>Ежедневный квиз</b>\n\n"
+        f"📝 <b>Заполните пропуск:</b>\n\n"
+        f"{QUIZ['sentence']}\n"
+        f"<i>({QUIZ['translation']})</i>"
+    )
+    return SendMessage(chat_id=user_id, text=message_text, reply_markup=keyboard, parse_mode="HTML")
+
+
+def prebuilt(payload):
+    def build(user_id):
+        return SendMessage(chat_id=user_id, text=payload.text, reply_markup=payload.reply_markup, parse_mode="HTML")
+    return build
+
+
+def measure(name, build, recipients):
+    started = time.perf_counter()
+    for user_id in range(recipients):
+        build(user_id)
+    cpu = (time.perf_counter() - started) / recipients
+
+    # Память, которую занимают объекты одного получателя
+    tracemalloc.start()
+    kept = [build(user_id) for user_id in range(1000)]
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    print(f"{name:6} {cpu * 1e6:7.1f} мкс на получателя  {allocated / 1000:7.0f} байт на получателя")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recipients", type=int, default=20000)
+    args = parser.parse_args()
+    measure("до", per_user, args.recipients)
+    measure("после", prebuilt(QuizPayload(QUIZ, quiz_id=1)), args.recipients)
+
+
+if __name__ == "__main__":
+    main()
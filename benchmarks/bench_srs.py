@@ -0,0 +1,72 @@
+"""Время выбора квиза интервальным повторением для всей базы пользователей.
+
+Создает базу, где каждый пользователь уже видел весь банк вопросов
+(худший случай для review_state), и выбирает слово для всех пользователей
+пачками, как это делает рассылка квиза.
+
+    python benchmarks/bench_srs.py --users 100000 --batch 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import _common  # noqa: F401
+
+from content import content
+from db import Database, AsyncDatabase
+from srs import SpacedRepetition
+
+
+def prepare(path, users, items):
+    db = Database(path)
+    today = date.today()
+    days = [(today + timedelta(days=offset)).isoformat() for offset in range(-30, 31)]
+    started = time.perf_counter()
+    with db.connection:
+        db.cursor.executemany("INSERT INTO users (user_id) VALUES (?)", ((i,) for i in range(users)))
+        db.cursor.executemany("INSERT INTO srs_progress (user_id, next_new) VALUES (?, ?)",
+                              ((i, len(items)) for i in range(users)))
+        db.cursor.executemany(
+            "INSERT INTO review_state (user_id, item, next_review) VALUES (?, ?, ?)",
+            ((user_id, item, random.choice(days)) for user_id in range(users) for item in items)
+        )
+    db.close()
+    print(f"База: {users} пользователей × {len(items)} слов = {users * len(items)} строк review_state "
+          f"за {time.perf_counter() - started:.0f} с")
+
+
+async def measure(path, users, batch):
+    db = AsyncDatabase(path)
+    srs = SpacedRepetition(db)
+    due = 0
+    started = time.perf_counter()
+    for start in range(0, users, batch):
+        assignments = await srs.select(list(range(start, min(start + batch, users))))
+        due += sum(not assignment.is_new for assignment in assignments.values())
+    elapsed = time.perf_counter() - started
+    await db.close()
+    print(f"Выбор для {users} пользователей пачками по {batch}: {elapsed:.2f} с "
+          f"({elapsed / users * 1e6:.1f} мкс на пользователя, {users / elapsed:.0f} пользователей/с), "
+          f"повторений {due}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    items = sorted(content.quizzes_by_word or content.words_by_word)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "srs.db")
+        prepare(path, args.users, items)
+        for batch in sorted({args.batch, 500}):
+            asyncio.run(measure(path, args.users, batch))
+
+
+if __name__ == "__main__":
+    main()
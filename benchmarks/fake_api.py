@@ -0,0 +1,193 @@
+"""Локальные имитации Telegram Bot API и Mistral AI для замеров без сети.
+
+Bot API (/bot<token>/<method>) отвечает с заданной задержкой, иногда
+возвращает 429 с retry_after, а часть пользователей «заблокировала» бота
+(403). Пользователь выбирается по chat_id, поэтому для одного и того же
+пользователя ответ всегда одинаковый. Mistral (/v1/chat/completions)
+отдаёт ответ потоком Server-Sent Events, как настоящий API.
+
+    python benchmarks/fake_api.py --port 8081 --latency 0.03 --flood-rate 0.001 --blocked-rate 0.02
+
+Бот направляется на имитацию переменными окружения:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 MISTRAL_SERVER_URL=http://127.0.0.1:8081
+
+GET /stats возвращает число запросов по методам и ответам.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+# Ответы на методы, которые не возвращают сообщение
+TRUE_METHODS = {"answercallbackquery", "deletemessage", "setwebhook", "deletewebhook", "sendchataction"}
+
+
+def is_blocked(chat_id, rate):
+    """Одни и те же пользователи «заблокировали» бота при каждом запуске"""
+    return (chat_id * 2654435761) % 10000 < rate * 10000
+
+
+class FakeTelegram:
+    def __init__(self, latency=0.03, jitter=0.01, flood_rate=0.0, retry_after=1, blocked_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+        self.stats = Counter()
+
+    def delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+    @staticmethod
+    def error(code, description, **parameters):
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=code)
+
+    def message(self, chat_id, params, method):
+        result = {
+            "message_id": int(params.get("message_id") or next(self.message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+        }
+        if method == "sendphoto":
+            file_id = params.get("photo")
+            if not isinstance(file_id, str):
+                file_id = f"fake-photo-{next(self.file_ids)}"
+            result["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1280, "height": 960}]
+            result["caption"] = params.get("caption", "")
+        else:
+            result["text"] = params.get("text", "")
+        return result
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        params = {}
+        if request.content_type == "application/json":
+            params = await request.json()
+        elif request.can_read_body:
+            for key, value in (await request.post()).items():
+                if isinstance(value, str):
+                    params[key] = value
+                else:
+                    # Загруженный файл читается целиком, как это сделал бы Telegram
+                    value.file.read()
+        await asyncio.sleep(self.delay())
+
+        chat_id = int(params.get("chat_id") or 0)
+        if method.startswith("send") and random.random() < self.flood_rate:
+            self.stats[method, 429] += 1
+            return self.error(429, f"Too Many Requests: retry after {self.retry_after}", retry_after=self.retry_after)
+        if chat_id and is_blocked(chat_id, self.blocked_rate):
+            self.stats[method, 403] += 1
+            return self.error(403, "Forbidden: bot was blocked by the user")
+
+        self.stats[method, 200] += 1
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "bot", "username": "fake_bot"}
+        elif method in TRUE_METHODS:
+            result = True
+        else:
+            result = self.message(chat_id, params, method)
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakeMistral:
+    def __init__(self, first_token_delay=0.3, token_delay=0.02, tokens=40, error_rate=0.0):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.stats = Counter()
+
+    @staticmethod
+    def chunk(model, content, finish_reason=None):
+        return {
+            "id": "fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}],
+        }
+
+    async def handle(self, request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        text = body["messages"][-1]["content"] or "가"
+        await asyncio.sleep(self.first_token_delay)
+        if random.random() < self.error_rate:
+            self.stats["chat", 503] += 1
+            return web.json_response({"message": "Service unavailable"}, status=503)
+        self.stats["chat", 200] += 1
+
+        tokens = [text[i % len(text)] for i in range(self.tokens)]
+        if not body.get("stream"):
+            return web.json_response({
+                "id": "fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "usage": {"prompt_tokens": len(text), "completion_tokens": self.tokens,
+                          "total_tokens": len(text) + self.tokens},
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            await response.write(f"data: {json.dumps(self.chunk(model, token))}\n\n".encode())
+        await response.write(f"data: {json.dumps(self.chunk(model, '', 'stop'))}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def create_app(telegram, mistral):
+    async def stats(request):
+        counts = {f"{name} {status}": count for (name, status), count in (telegram.stats + mistral.stats).items()}
+        return web.json_response(dict(sorted(counts.items())))
+
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app.router.add_post("/bot{token}/{method}", telegram.handle)
+    app.router.add_post("/v1/chat/completions", mistral.handle)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитация Telegram Bot API и Mistral AI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.03, help="средняя задержка Bot API, с")
+    parser.add_argument("--jitter", type=float, default=0.01, help="разброс задержки Bot API, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля отправок с ответом 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="доля пользователей, заблокировавших бота")
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--ai-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    telegram = FakeTelegram(args.latency, args.jitter, args.flood_rate, args.retry_after, args.blocked_rate)
+    mistral = FakeMistral(args.first_token_delay, args.token_delay, args.tokens, args.ai_error_rate)
+    web.run_app(create_app(telegram, mistral), host=args.host, port=args.port, access_log=None,
+                print=lambda message: print(f"Имитация API: http://{args.host}:{args.port}", flush=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""Набор замеров бота против локальных имитаций Bot API и Mistral (benchmarks/fake_api.py).
+
+Для каждого размера базы создаётся синтетическая база пользователей и по
+очереди запускаются сценарии:
+
+- word — рассылка слова дня всем пользователям (send_word)
+- quiz — рассылка квиза с подбором слова каждому пользователю (send_quiz)
+- answer — ответы на квиз через диспетчер (handle_quiz_answer)
+- spellcheck — проверка орфографии с потоковым ответом модели
+
+Каждый сценарий выполняется в отдельном процессе, поэтому пиковая память
+(peak RSS) относится только к нему. Для рассылок задержка — время запроса
+к Bot API, для обработчиков — время обработки обновления целиком.
+
+    python benchmarks/run_suite.py --sizes 1000 100000 1000000
+    python benchmarks/run_suite.py --sizes 1000 --scenarios answer spellcheck --latency 0.05 --blocked-rate 0.02
+
+Лимит скорости рассылки по умолчанию поднят (--rate), чтобы замер показывал
+накладные расходы бота, а не ограничение Telegram.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from _common import ROOT, percentile
+from fake_api import is_blocked
+
+SCENARIOS = ("word", "quiz", "answer", "spellcheck")
+TEXTS = ["저는 학생 이에요", "어제 학교에 갔어요", "한국어를 공부해요", "오늘 날씨가 좋네요"]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает килобайты, macOS — байты
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def prepare(path, users):
+    from db import Database
+
+    db = Database(path)
+    started = time.perf_counter()
+    with db.connection:
+        db.cursor.executemany("INSERT INTO users (user_id) VALUES (?)", ((i,) for i in range(1, users + 1)))
+    db.close()
+    print(f"База: {users} пользователей за {time.perf_counter() - started:.1f} с", flush=True)
+
+
+def sample_users(users, count, blocked_rate):
+    """Пользователи, которые пишут боту: заблокировавшие его обновлений не присылают"""
+    active = [user_id for user_id in range(1, users + 1) if not is_blocked(user_id, blocked_rate)]
+    return random.sample(active, min(count, len(active)))
+
+
+def make_message(update_id, user_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def make_answer(update_id, user_id, callback_data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "chat_instance": str(user_id),
+            "data": callback_data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "Ежедневный квиз",
+            },
+        },
+    }
+
+
+def timed_requests(latencies):
+    """Middleware сессии aiogram: время каждого запроса к Bot API"""
+    async def middleware(make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return middleware
+
+
+async def run_concurrently(updates, concurrency, feed):
+    """Обрабатывает обновления с concurrency одновременными пользователями"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(update):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await feed(update)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(update) for update in updates))
+    return latencies, errors
+
+
+async def bench_broadcast(kind, args):
+    import scheduler
+
+    latencies = []
+    scheduler.bot.session.middleware(timed_requests(latencies))
+    started = time.perf_counter()
+    await (scheduler.send_word() if kind == "word" else scheduler.send_quiz())
+    elapsed = time.perf_counter() - started
+    summary = await scheduler.db.get_broadcast_job_summary(scheduler.make_job_id(kind))
+    await scheduler.db.close()
+    await scheduler.bot.session.close()
+    total = sum(summary.values())
+    # Недоставленные: заблокировавшие бота и ошибки после всех повторов
+    return total, elapsed, latencies, total - summary.get("sent", 0)
+
+
+async def bench_handlers(scenario, args):
+    import Telegram_Korean as app
+    import scheduler
+    from aiogram.fsm.storage.base import StorageKey
+    from db import Database
+    from quiz_store import encode_answer
+
+    count = args.updates if scenario == "answer" else args.ai_requests
+    users = sample_users(args.users, count, args.blocked_rate)
+    if scenario == "answer":
+        # Ответы приходят на квизы, разосланные сценарием quiz; остальным выдаём общий квиз
+        sync_db = Database(args.db)
+        active = dict(sync_db.cursor.execute("SELECT user_id, quiz_id FROM active_quizzes").fetchall())
+        missing = [user_id for user_id in users if user_id not in active]
+        if missing:
+            quiz = await scheduler.create_quiz_question()
+            quiz_id = sync_db.create_quiz_instance(
+                quiz["correct_word"], quiz["original_sentence"], quiz["options"], quiz["correct_index"]
+            )
+            sync_db.save_active_quizzes([(user_id, quiz_id) for user_id in missing])
+            active.update((user_id, quiz_id) for user_id in missing)
+        sync_db.close()
+        updates = [make_answer(i, user_id, encode_answer(active[user_id], random.randrange(4)))
+                   for i, user_id in enumerate(users, 1)]
+    else:
+        # Состояние ожидания текста, в которое переводит кнопка меню, задаём напрямую:
+        # подготовка не ходит в Bot API и не прерывается ответами 429 при --flood-rate
+        for user_id in users:
+            key = StorageKey(bot_id=app.bot.id, chat_id=user_id, user_id=user_id)
+            await app.fsm_storage.set_state(key, app.SpellCheckStates.waiting_for_text_to_check)
+        updates = [make_message(len(users) + i, user_id, f"{random.choice(TEXTS)} {user_id}")
+                   for i, user_id in enumerate(users, 1)]
+
+    started = time.perf_counter()
+    latencies, errors = await run_concurrently(
+        updates, args.concurrency, lambda update: app.dp.feed_raw_update(app.bot, update)
+    )
+    elapsed = time.perf_counter() - started
+    await app.fsm_storage.close()
+    await scheduler.db.close()
+    await app.bot.session.close()
+    return len(updates), elapsed, latencies, errors
+
+
+async def run_scenario(args):
+    """Выполняется в дочернем процессе: окружение бота уже направлено на имитации"""
+    bench = bench_broadcast if args.scenario in ("word", "quiz") else bench_handlers
+    count, elapsed, latencies, errors = await bench(args.scenario, args)
+    result = {
+        "count": count,
+        "elapsed": elapsed,
+        "throughput": count / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p99": percentile(latencies, 0.99) if latencies else 0.0,
+        "errors": errors,
+        "rss": peak_rss_mb(),
+    }
+    print("RESULT " + json.dumps(result), flush=True)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_api(args):
+    port = free_port()
+    command = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "fake_api.py"), "--port", str(port),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--flood-rate", str(args.flood_rate), "--blocked-rate", str(args.blocked_rate),
+        "--first-token-delay", str(args.first_token_delay), "--token-delay", str(args.token_delay),
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            urllib.request.urlopen(url + "/stats", timeout=1).read()
+            return server, url
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.kill()
+                raise RuntimeError("имитация API не запустилась")
+            time.sleep(0.1)
+
+
+def run_child(scenario, users, db_path, url, args):
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:benchmark",
+        ADMIN_ID="0",
+        API_KEY="benchmark",
+        AI_BACKEND="mistral",
+        DATABASE_PATH=db_path,
+        TELEGRAM_API_URL=url,
+        MISTRAL_SERVER_URL=url,
+        METRICS_PORT="0",
+        BROADCAST_GLOBAL_RATE=str(args.rate),
+        BROADCAST_WORKERS=str(args.workers),
+        MAX_REQUESTS_PER_DAY="1000",
+    )
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", scenario, "--db", db_path,
+        "--users", str(users), "--updates", str(args.updates), "--ai-requests", str(args.ai_requests),
+        "--concurrency", str(args.concurrency),
+        "--blocked-rate", str(args.blocked_rate),
+    ]
+    process = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+    for line in process.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"сценарий {scenario} завершился с ошибкой:\n{process.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--updates", type=int, default=2000, help="ответов на квиз в сценарии answer")
+    parser.add_argument("--ai-requests", type=int, default=200, help="запросов в сценарии spellcheck")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=100000, help="BROADCAST_GLOBAL_RATE для рассылок")
+    parser.add_argument("--workers", type=int, default=200, help="BROADCAST_WORKERS для рассылок")
+    parser.add_argument("--latency", type=float, default=0.03)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--blocked-rate", type=float, default=0.01)
+    parser.add_argument("--first-token-delay", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    # Внутренние параметры дочернего процесса
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--users", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.scenario = args.child
+        asyncio.run(run_scenario(args))
+        return
+
+    server, url = start_fake_api(args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for users in args.sizes:
+                db_path = os.path.join(tmp, f"bench_{users}.db")
+                prepare(db_path, users)
+                for scenario in args.scenarios:
+                    result = run_child(scenario, users, db_path, url, args)
+                    print(
+                        f"{users:>8} польз. {scenario:<11} {result['count']:>8} за {result['elapsed']:7.1f} с  "
+                        f"{result['throughput']:8.0f}/с  p50 {result['p50'] * 1000:7.1f} мс  "
+                        f"p99 {result['p99'] * 1000:7.1f} мс  ошибок {result['errors']:<5} "
+                        f"peak RSS {result['rss']:6.0f} МБ",
+                        flush=True,
+                    )
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Нагрузочный тест webhook: отправляет синтетические обновления на локальный сервер.
+
+Сначала запустите сервер без регистрации в Telegram:
+
+    python webhook.py --workers 4 --skip-set-webhook
+
+и затем:
+
+    python benchmarks/webhook_load.py --updates 20000 --concurrency 200
+
+Скрипт отправляет смесь обновлений (пункты меню, ответы на квиз, неизвестные
+сообщения) и выводит число принятых обновлений в секунду и задержку ответа
+сервера. Для сравнения с polling: один цикл getUpdates забирает не больше
+100 обновлений за запрос и обрабатывается одним процессом, поэтому его
+потолок — 100 / (время запроса getUpdates) обновлений в секунду.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import statistics
+import time
+
+import aiohttp
+
+from _common import percentile
+
+TEXTS = ["Моя статистика 📊", "Подготовка TOPIK", "Обратная связь 🧡", "привет"]
+
+
+def make_update(update_id, user_id):
+    sender = {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    chat = {"id": user_id, "type": "private", "first_name": sender["first_name"]}
+    if update_id % 5 == 0:
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": sender,
+                "chat_instance": str(user_id),
+                "data": "stay_subscribed",
+                "message": {"message_id": update_id, "date": int(time.time()), "chat": chat, "text": "квиз"},
+            },
+        }
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": sender,
+            "text": random.choice(TEXTS),
+        },
+    }
+
+
+async def main():
+    from configuration import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    args = parser.parse_args()
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    update_ids = itertools.count(1)
+    latencies, errors = [], 0
+
+    async def client(session):
+        nonlocal errors
+        while True:
+            update_id = next(update_ids)
+            if update_id > args.updates:
+                return
+            update = make_update(update_id, 1 + update_id % args.users)
+            started = time.perf_counter()
+            try:
+                async with session.post(args.url, json=update, headers=headers) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    print(
+        f"{args.updates} обновлений за {elapsed:.1f} с: {args.updates / elapsed:.0f} updates/s, "
+        f"ошибок {errors}, задержка p50 {statistics.median(latencies) * 1000:.1f} мс, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
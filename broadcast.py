@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.exceptions import (
+    TelegramRetryAfter,
+    TelegramNetworkError,
+    TelegramServerError,
+    TelegramBadRequest,
+    TelegramForbiddenError,
+)
+
+from configuration import (
+    BROADCAST_WORKERS,
+    BROADCAST_GLOBAL_RATE,
+    BROADCAST_PER_CHAT_RATE,
+    BROADCAST_MAX_RETRIES,
+)
+from metrics import BROADCAST_MESSAGES, BROADCAST_RETRIES, BROADCAST_FLOOD_WAITS
+
+
+# Ответы Telegram, после которых сообщения пользователю больше не доставить
+PERMANENT_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+
+def is_permanent_error(error):
+    """Постоянная ошибка: бот заблокирован, чат не найден или аккаунт удален"""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and any(
+        text in str(error).lower() for text in PERMANENT_ERRORS
+    )
+
+
+class TokenBucket:
+    """Ведро токенов: не больше rate операций в секунду с запасом burst"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def is_full(self):
+        """Ведро наполнилось и ничем не отличается от нового"""
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов на seconds секунд (после RetryAfter)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class BroadcastReport:
+    def __init__(self, name):
+        self.name = name
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"📊 Итог рассылки «{self.name}»: успешно {self.sent}/{self.total}, "
+            f"ошибок {self.failed} (недоступны {self.blocked}), повторов {self.retries}, flood-wait {self.flood_waits}, "
+            f"{self.elapsed:.1f} с ({self.rate:.1f} сообщ./с)"
+        )
+
+
+class Broadcaster:
+    """Параллельная рассылка с учётом лимитов Telegram.
+
+    Общее ведро токенов ограничивает скорость всего бота, отдельные ведра —
+    скорость для каждого чата. Одно ведро делят все рассылки процесса.
+    Ведра чатов живут, пока не наполнятся снова, — так лимит на чат действует
+    и между рассылками, а в памяти остаются только недавно использованные.
+    """
+
+    def __init__(self, workers=BROADCAST_WORKERS, global_rate=BROADCAST_GLOBAL_RATE,
+                 per_chat_rate=BROADCAST_PER_CHAT_RATE, max_retries=BROADCAST_MAX_RETRIES):
+        self.workers = workers
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_buckets = OrderedDict()  # chat_id -> TokenBucket, от давно использованных к недавним
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.pop(chat_id, None) or TokenBucket(self.per_chat_rate, burst=1)
+        # Наполнившиеся ведра не ограничивают отправку — забываем их
+        while self.chat_buckets and next(iter(self.chat_buckets.values())).is_full():
+            self.chat_buckets.popitem(last=False)
+        self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def _deliver(self, chat_id, send, report, on_failure=None):
+        bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            await self.global_bucket.acquire()
+            await bucket.acquire()
+            try:
+                await send(chat_id)
+                report.sent += 1
+                BROADCAST_MESSAGES.labels(report.name, "sent").inc()
+                return
+            except TelegramRetryAfter as e:
+                # Telegram просит подождать — притормаживаем всю рассылку
+                report.flood_waits += 1
+                BROADCAST_FLOOD_WAITS.labels(report.name).inc()
+                self.global_bucket.pause(e.retry_after)
+                bucket.pause(e.retry_after)
+                error = e
+            except (TelegramNetworkError, TelegramServerError) as e:
+                await asyncio.sleep(min(2 ** attempt, 30))
+                error = e
+            except Exception as e:
+                error = e
+                break
+            if attempt < self.max_retries:
+                report.retries += 1
+                BROADCAST_RETRIES.labels(report.name).inc()
+        report.failed += 1
+        if is_permanent_error(error):
+            report.blocked += 1
+            BROADCAST_MESSAGES.labels(report.name, "blocked").inc()
+            logging.info(f"🚫 Рассылка «{report.name}»: пользователь {chat_id} недоступен: {error}")
+        else:
+            BROADCAST_MESSAGES.labels(report.name, "failed").inc()
+            logging.warning(f"❌ Рассылка «{report.name}»: ошибка отправки пользователю {chat_id}: {error}")
+        if on_failure is not None:
+            await on_failure(chat_id, error)
+
+    async def run(self, name, recipients, send, on_failure=None):
+        """Отправляет сообщение всем recipients, вызывая send(chat_id) для каждого.
+
+        recipients — обычный или асинхронный итератор id чатов; on_failure(chat_id, error)
+        вызывается, если отправить сообщение так и не удалось.
+        """
+        report = BroadcastReport(name)
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+
+        async def worker():
+            while True:
+                chat_id = await queue.get()
+                try:
+                    if chat_id is None:
+                        return
+                    await self._deliver(chat_id, send, report, on_failure)
+                finally:
+                    queue.task_done()
+
+        started = time.monotonic()
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        try:
+            if hasattr(recipients, "__aiter__"):
+                async for chat_id in recipients:
+                    report.total += 1
+                    await queue.put(chat_id)
+            else:
+                for chat_id in recipients:
+                    report.total += 1
+                    await queue.put(chat_id)
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        report.elapsed = time.monotonic() - started
+        logging.info(str(report))
+        return report
+
+
+broadcaster = Broadcaster()
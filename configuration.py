@@ -9,11 +9,83 @@ API_KEY = os.getenv("API_KEY")
 MODEL_NAME = os.getenv("MODEL_NAME", "codestral-latest")
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_PATH = os.getenv("DATABASE_PATH", "korean_bot.db")
+# Пакетная запись: размер пачки и интервал сброса в секундах
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "500"))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "2"))
 MAX_REQUESTS_PER_DAY = int(os.getenv("MAX_REQUESTS_PER_DAY", "10"))
+# Хранилище лимитов запросов: sqlite (общее для всех процессов) или memory
+QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "sqlite")
 ADMIN_ID = int(os.getenv("ADMIN_ID"))
 
+# Другие адреса API (локальный сервер Bot API, имитации для замеров); пусто — стандартные
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+MISTRAL_SERVER_URL = os.getenv("MISTRAL_SERVER_URL", "")
+
+# Исходящие запросы к Bot API: соединений в общем пуле и сколько из них не отдаётся рассылкам
+OUTBOUND_MAX_CONNECTIONS = int(os.getenv("OUTBOUND_MAX_CONNECTIONS", "100"))
+OUTBOUND_INTERACTIVE_RESERVE = int(os.getenv("OUTBOUND_INTERACTIVE_RESERVE", "20"))
+
+# Обращения к ИИ: бэкенд (mistral или mock), одновременные запросы, таймаут в секундах, повторы
+AI_BACKEND = os.getenv("AI_BACKEND", "mistral")
+AI_MAX_IN_FLIGHT = int(os.getenv("AI_MAX_IN_FLIGHT", "8"))
+AI_TIMEOUT = float(os.getenv("AI_TIMEOUT", "60"))
+AI_MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+
+# Кэш ответов ИИ: записей в памяти, время жизни в секундах, расходует ли ответ из кэша лимит запросов
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1000"))
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", str(7 * 24 * 3600)))
+AI_CACHE_HITS_COUNT_AGAINST_LIMIT = os.getenv("AI_CACHE_HITS_COUNT_AGAINST_LIMIT", "false").lower() == "true"
+
+# Потоковый ответ ИИ: редактировать сообщение по мере генерации и как часто (секунды между правками)
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Режим webhook (python webhook.py): публичный адрес, путь, секрет, адрес прослушивания,
+# число процессов и время ожидания обработки обновлений при остановке
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+# Подготовленные изображения слов (python manage.py build-assets): каталог,
+# наибольшая сторона в пикселях и качество JPEG
+ASSETS_DIR = os.getenv("ASSETS_DIR", "assets")
+ASSET_MAX_SIZE = int(os.getenv("ASSET_MAX_SIZE", "1280"))
+ASSET_JPEG_QUALITY = int(os.getenv("ASSET_JPEG_QUALITY", "85"))
+
+# Состояния диалогов (FSM): записей в памяти, сколько секунд запись в памяти считается
+# актуальной (другие процессы могли её изменить), интервал пакетной записи и время
+# жизни неактивного состояния в секундах
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CACHE_FRESHNESS = float(os.getenv("FSM_CACHE_FRESHNESS", "1"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "0.5"))
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(24 * 3600)))
+
+# Метрики в формате Prometheus: адрес и порт (0 — выключены, по умолчанию); процессы
+# webhook занимают порты METRICS_PORT, METRICS_PORT + 1, ...
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Сколько экземпляров квиза держать в памяти для обработки ответов
+QUIZ_CACHE_SIZE = int(os.getenv("QUIZ_CACHE_SIZE", "64"))
+
+# Настройки рассылки (лимиты Telegram: ~30 сообщений в секунду на бота, 1 в секунду на чат)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+BROADCAST_GLOBAL_RATE = float(os.getenv("BROADCAST_GLOBAL_RATE", "25"))
+BROADCAST_PER_CHAT_RATE = float(os.getenv("BROADCAST_PER_CHAT_RATE", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Часовой пояс пользователей, не выбравших свой, и окно (в минутах), по которому
+# распределяется ежедневная рассылка после местного времени отправки
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Europe/Moscow")
+DELIVERY_WINDOW_MINUTES = int(os.getenv("DELIVERY_WINDOW_MINUTES", "30"))
+# Сколько минут после окна ещё досылать слоты, пропущенные из-за остановки бота
+DELIVERY_CATCHUP_MINUTES = int(os.getenv("DELIVERY_CATCHUP_MINUTES", "120"))
+# Сколько получателей брать в работу за одну контрольную точку журнала рассылки
+BROADCAST_CHECKPOINT_SIZE = int(os.getenv("BROADCAST_CHECKPOINT_SIZE", "50"))
+
 # Стили для генерации контента
 TEXT_STYLE = "Дружелюбный и информативный тон"
-
-# Другие настройки
-user_requests = {}
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import os
+from collections import namedtuple
+
+from assets import AssetManifest
+
+# Слово дня: id — позиция записи в words.json (пропущенные записи не сдвигают следующие)
+Word = namedtuple("Word", "id word translation image example")
+# Квиз: предложение с пропуском и неправильные варианты ответа
+Quiz = namedtuple("Quiz", "word translation sentence original_sentence wrong_options")
+
+
+class ContentRepository:
+    """Слова и квизы в памяти с индексами для быстрого поиска.
+
+    Файлы читаются один раз и перечитываются только если изменились
+    (сначала проверяются mtime и размер, затем хэш содержимого).
+    Некорректные записи отбрасываются при загрузке с предупреждением в логе.
+    Изображения слов заменяются подготовленными файлами из манифеста
+    assets/manifest.json, если он есть.
+    """
+
+    def __init__(self, words_path="words.json", quiz_path="quiz_data.json", assets=None):
+        self.words_path = words_path
+        self.quiz_path = quiz_path
+        self.assets = assets or AssetManifest()
+        self.word_entries = None
+        self.versions = {}
+        self.words = []
+        self.words_by_id = {}
+        self.words_by_word = {}
+        self.words_by_image = {}
+        self.quizzes = []
+        self.quizzes_by_word = {}
+        self.refresh()
+
+    def _read_if_changed(self, path, required=True):
+        """Возвращает содержимое файла, если оно изменилось с прошлой загрузки"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Сообщаем об отсутствии файла один раз, а не при каждой проверке
+            if required and self.versions.get(path, ()) is not None:
+                logging.error(f"❌ Файл {path} не найден")
+            self.versions[path] = None
+            return None
+        version = self.versions.get(path)
+        if version and version[:2] == (stat.st_mtime_ns, stat.st_size):
+            return None
+        with open(path, "rb") as f:
+            raw = f.read()
+        content_hash = hashlib.sha256(raw).hexdigest()
+        self.versions[path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        if version and version[2] == content_hash:
+            return None
+        return raw
+
+    def refresh(self):
+        """Перечитывает изменившиеся файлы; при ошибке остаётся прежнее содержимое"""
+        # Манифест изображений необязателен: без него отправляются исходные файлы
+        raw = self._read_if_changed(self.assets.path, required=False)
+        assets_changed = raw is not None
+        if raw is not None:
+            self.assets.load(raw)
+        elif self.versions.get(self.assets.path) is None and self.assets.images:
+            self.assets.images = {}
+            assets_changed = True
+
+        raw = self._read_if_changed(self.words_path)
+        if raw is not None:
+            try:
+                self._load_words(json.loads(raw))
+            except (json.JSONDecodeError, UnicodeDecodeError, TypeError) as e:
+                logging.error(f"❌ Ошибка чтения {self.words_path}: {e}")
+        elif assets_changed and self.word_entries is not None:
+            self._load_words(self.word_entries)
+
+        raw = self._read_if_changed(self.quiz_path)
+        if raw is not None:
+            try:
+                self._load_quizzes(json.loads(raw).get("quiz_questions", []))
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError, TypeError) as e:
+                logging.error(f"❌ Ошибка чтения {self.quiz_path}: {e}")
+
+    def _load_words(self, entries):
+        words, by_id, by_word, by_image = [], {}, {}, {}
+        for position, entry in enumerate(entries):
+            try:
+                word = Word(position, entry["word"], entry["translation"], self.assets.resolve(entry["image"]),
+                            entry.get("example", "Пример отсутствует."))
+            except (KeyError, TypeError):
+                logging.warning(f"⚠️ {self.words_path}: пропущена запись без обязательных полей: {entry}")
+                continue
+            if word.word in by_word:
+                logging.warning(f"⚠️ {self.words_path}: слово «{word.word}» повторяется, оставлена первая запись")
+                continue
+            if not os.path.isfile(word.image):
+                logging.warning(f"⚠️ {self.words_path}: нет изображения {word.image} для слова «{word.word}»")
+                continue
+            words.append(word)
+            by_id[word.id] = word
+            by_word[word.word] = word
+            by_image.setdefault(word.image, word)
+        self.words, self.words_by_id, self.words_by_word, self.words_by_image = words, by_id, by_word, by_image
+        self.word_entries = entries
+        logging.info(f"📚 Загружено слов: {len(words)}")
+
+    def _load_quizzes(self, entries):
+        quizzes, by_word = [], {}
+        for entry in entries:
+            try:
+                quiz = Quiz(entry["word"], entry["translation"], entry["sentence"],
+                            entry["original_sentence"], tuple(dict.fromkeys(entry["wrong_options"])))
+            except (KeyError, TypeError):
+                logging.warning(f"⚠️ {self.quiz_path}: пропущен квиз без обязательных полей: {entry}")
+                continue
+            if quiz.word in quiz.wrong_options:
+                logging.warning(f"⚠️ {self.quiz_path}: ответ «{quiz.word}» есть среди неправильных вариантов")
+                continue
+            if not quiz.wrong_options:
+                logging.warning(f"⚠️ {self.quiz_path}: у квиза «{quiz.word}» нет неправильных вариантов")
+                continue
+            quizzes.append(quiz)
+            by_word.setdefault(quiz.word, []).append(quiz)
+        self.quizzes, self.quizzes_by_word = quizzes, by_word
+        logging.info(f"📝 Загружено квизов: {len(quizzes)}")
+
+
+content = ContentRepository()
@@ -1,12 +1,82 @@
+import asyncio
+import functools
+import json
+import logging
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from configuration import DB_BATCH_SIZE, DB_FLUSH_INTERVAL
+from metrics import DB_QUERY_DURATION
+
 
 class Database:
     def __init__(self, db_file):
-        self.connection = sqlite3.connect(db_file)
+        self.connection = sqlite3.connect(db_file, check_same_thread=False)
         self.cursor = self.connection.cursor()
+        self.init_pragmas()
+        self.init_users_table()
         self.init_quiz_stats_table()
+        self.migrate_quiz_stats_unique()
+        self.init_photo_file_ids_table()
+        self.init_quiz_totals_table()
+        self.init_request_quota_table()
+        self.init_response_cache_table()
+        self.init_broadcast_journal_tables()
+        self.init_review_tables()
+        self.init_word_progress_table()
+        self.init_fsm_table()
+
+    def init_pragmas(self):
+        """Настраивает SQLite: WAL позволяет читать параллельно с записью"""
+        self.cursor.execute("PRAGMA journal_mode = WAL")
+        self.cursor.execute("PRAGMA synchronous = NORMAL")
+        self.cursor.execute("PRAGMA busy_timeout = 5000")
+        self.cursor.execute("PRAGMA temp_store = MEMORY")
+        self.cursor.execute("PRAGMA cache_size = -16000")
+
+    def init_users_table(self):
+        """Создает таблицу пользователей, если её нет"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY
+                )
+            """)
+            # В старых базах таблица users создана без ограничения уникальности,
+            # а add_user опирается на ON CONFLICT(user_id)
+            if not self._users_user_id_unique():
+                self.cursor.execute("""
+                    DELETE FROM users WHERE rowid NOT IN (SELECT MAX(rowid) FROM users GROUP BY user_id)
+                """)
+                self.cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
+            # active = 0 — пользователь заблокировал бота или удалил аккаунт, рассылка ему не идет
+            columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(users)")]
+            if "active" not in columns:
+                self.cursor.execute("ALTER TABLE users ADD COLUMN active INTEGER NOT NULL DEFAULT 1")
+                self.cursor.execute("ALTER TABLE users ADD COLUMN deactivated_at TIMESTAMP")
+            # Частичный индекс: выборка получателей читает только активных пользователей
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_active
+                ON users(user_id) WHERE active = 1
+            """)
+            # tz — часовой пояс пользователя (IANA), NULL — пояс по умолчанию
+            if "tz" not in columns:
+                self.cursor.execute("ALTER TABLE users ADD COLUMN tz TEXT")
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_users_tz_active
+                ON users(tz, user_id) WHERE active = 1
+            """)
+
+    def _users_user_id_unique(self):
+        """Есть ли на users.user_id первичный ключ или уникальный индекс"""
+        info = self.cursor.execute("PRAGMA table_info(users)").fetchall()
+        if [row[1] for row in info if row[5]] == ["user_id"]:
+            return True
+        for _, name, unique, *_ in self.cursor.execute("PRAGMA index_list(users)").fetchall():
+            if unique and [row[2] for row in self.cursor.execute(f"PRAGMA index_info('{name}')")] == ["user_id"]:
+                return True
+        return False
 
     def init_quiz_stats_table(self):
         """Создает таблицу для статистики квизов, если её нет"""
@@ -22,126 +92,753 @@ class Database:
                     FOREIGN KEY (user_id) REFERENCES users(user_id)
                 )
             """)
-            # Создаем индекс для быстрого поиска
+            # Создаем таблицу экземпляров квиза: один на рассылку, а не на пользователя
             self.cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_user_date 
-                ON quiz_stats(user_id, quiz_date)
+                CREATE TABLE IF NOT EXISTS quiz_instances (
+                    quiz_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    correct_word TEXT NOT NULL,
+                    original_sentence TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    correct_index INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
             """)
+            # Старая таблица активных квизов хранила слово и предложение для каждого пользователя
+            columns = [row[1] for row in self.cursor.execute("PRAGMA table_info(active_quizzes)")]
+            if columns and "quiz_id" not in columns:
+                self.cursor.execute("DROP TABLE active_quizzes")
             # Создаем таблицу для активных квизов
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS active_quizzes (
                     user_id INTEGER PRIMARY KEY,
-                    correct_word TEXT NOT NULL,
-                    original_sentence TEXT NOT NULL,
+                    quiz_id INTEGER NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                    FOREIGN KEY (user_id) REFERENCES users(user_id),
+                    FOREIGN KEY (quiz_id) REFERENCES quiz_instances(quiz_id)
                 )
             """)
 
+    def init_photo_file_ids_table(self):
+        """Создает таблицу file_id загруженных в Telegram изображений"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS photo_file_ids (
+                    image_path TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (image_path, content_hash)
+                )
+            """)
+
+    def init_quiz_totals_table(self):
+        """Создает таблицу итоговой статистики пользователей и заполняет её при первом запуске"""
+        exists = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_quiz_totals'"
+        ).fetchone()
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS user_quiz_totals (
+                    user_id INTEGER PRIMARY KEY,
+                    correct_answers INTEGER NOT NULL DEFAULT 0,
+                    total_answers INTEGER NOT NULL DEFAULT 0,
+                    current_streak INTEGER NOT NULL DEFAULT 0,
+                    best_streak INTEGER NOT NULL DEFAULT 0,
+                    last_quiz_date DATE
+                )
+            """)
+        if not exists:
+            self.backfill_quiz_totals()
+
+    def backfill_quiz_totals(self):
+        """Пересчитывает user_quiz_totals по всей истории quiz_stats"""
+        rows = []
+        current = None
+        for user_id, quiz_date, correct, total in self.connection.execute("""
+            SELECT user_id, quiz_date, correct_answers, total_answers
+            FROM quiz_stats ORDER BY user_id, quiz_date
+        """):
+            day = datetime.strptime(quiz_date, "%Y-%m-%d").date()
+            if current is None or current[0] != user_id:
+                current = [user_id, 0, 0, 0, 0, None]
+                rows.append(current)
+            last_day = current[5]
+            current[1] += correct or 0
+            current[2] += total or 0
+            current[3] = current[3] + 1 if last_day and (day - last_day).days == 1 else 1
+            current[4] = max(current[4], current[3])
+            current[5] = day
+        with self.connection:
+            self.cursor.execute("DELETE FROM user_quiz_totals")
+            self.cursor.executemany("""
+                INSERT INTO user_quiz_totals
+                    (user_id, correct_answers, total_answers, current_streak, best_streak, last_quiz_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+
+    def init_request_quota_table(self):
+        """Создает таблицу дневных лимитов запросов к ИИ"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS request_quota (
+                    user_id INTEGER NOT NULL,
+                    day DATE NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, day)
+                ) WITHOUT ROWID
+            """)
+
+    def init_response_cache_table(self):
+        """Создает таблицу кэша ответов ИИ"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def init_review_tables(self):
+        """Создает таблицы интервального повторения квизов (SM-2)"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS review_state (
+                    user_id INTEGER NOT NULL,
+                    item TEXT NOT NULL,
+                    easiness REAL NOT NULL DEFAULT 2.5,
+                    interval INTEGER NOT NULL DEFAULT 0,
+                    repetitions INTEGER NOT NULL DEFAULT 0,
+                    next_review DATE NOT NULL,
+                    PRIMARY KEY (user_id, item)
+                ) WITHOUT ROWID
+            """)
+            # Слово с ближайшим сроком повторения находится одним поиском по индексу
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_review_due
+                ON review_state(user_id, next_review)
+            """)
+            # next_new — позиция следующего нового слова в перестановке банка вопросов пользователя
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS srs_progress (
+                    user_id INTEGER PRIMARY KEY,
+                    next_new INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+
+    def init_word_progress_table(self):
+        """Создает таблицу слов дня, уже отправленных пользователю"""
+        with self.connection:
+            # seen — битовое множество: бит i (little-endian) — слово на позиции i в words.json
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS word_progress (
+                    user_id INTEGER PRIMARY KEY,
+                    seen BLOB NOT NULL
+                )
+            """)
+
+    def init_fsm_table(self):
+        """Создает таблицу состояний диалогов (FSM)"""
+        with self.connection:
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    storage_key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    updated_at REAL NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_fsm_states_updated
+                ON fsm_states(updated_at)
+            """)
+
+    def init_broadcast_journal_tables(self):
+        """Создает журнал рассылок: задания и статус доставки каждому получателю"""
+        with self.connection:
+            # Получатели добавляются по мере наступления времени рассылки в их часовом поясе
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            # status: pending → sending (взят в работу) → sent / failed / blocked;
+            # unknown — отправка прервана падением процесса, повторно не отправляется
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    job_id TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    PRIMARY KEY (job_id, user_id)
+                ) WITHOUT ROWID
+            """)
+            # Частичный индекс: следующая пачка читается без просмотра уже отправленных
+            # (без статистики планировщик выбирает первичный ключ, поэтому индекс указан явно)
+            self.cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_broadcast_pending
+                ON broadcast_deliveries(job_id, user_id) WHERE status = 'pending'
+            """)
+
+    def migrate_quiz_stats_unique(self):
+        """Объединяет повторяющиеся записи (user_id, quiz_date) и создает уникальный индекс"""
+        exists = self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_quiz_stats_user_date'"
+        ).fetchone()
+        if exists:
+            return
+        with self.connection:
+            # Суммы переносим в самую раннюю запись дня, последнее слово — из самой поздней
+            self.cursor.execute("""
+                UPDATE quiz_stats SET
+                    correct_answers = (SELECT SUM(d.correct_answers) FROM quiz_stats d
+                                       WHERE d.user_id = quiz_stats.user_id AND d.quiz_date = quiz_stats.quiz_date),
+                    total_answers = (SELECT SUM(d.total_answers) FROM quiz_stats d
+                                     WHERE d.user_id = quiz_stats.user_id AND d.quiz_date = quiz_stats.quiz_date),
+                    last_quiz_word = (SELECT d.last_quiz_word FROM quiz_stats d
+                                      WHERE d.user_id = quiz_stats.user_id AND d.quiz_date = quiz_stats.quiz_date
+                                      ORDER BY d.id DESC LIMIT 1)
+                WHERE id IN (SELECT MIN(id) FROM quiz_stats GROUP BY user_id, quiz_date HAVING COUNT(*) > 1)
+            """)
+            self.cursor.execute("""
+                DELETE FROM quiz_stats
+                WHERE id NOT IN (SELECT MIN(id) FROM quiz_stats GROUP BY user_id, quiz_date)
+            """)
+            # Уникальный индекс заменяет прежний обычный индекс idx_user_date
+            self.cursor.execute("DROP INDEX IF EXISTS idx_user_date")
+            self.cursor.execute("""
+                CREATE UNIQUE INDEX uq_quiz_stats_user_date
+                ON quiz_stats(user_id, quiz_date)
+            """)
+
     def user_exists(self, user_id):
+        """Проверяет, есть ли активный пользователь"""
         with self.connection:
-            result = self.cursor.execute("SELECT * FROM `users` WHERE `user_id` = ?", (user_id,)).fetchone()
+            result = self.cursor.execute(
+                "SELECT 1 FROM `users` WHERE `user_id` = ? AND `active` = 1", (user_id,)
+            ).fetchone()
             return result is not None
 
     def add_user(self, user_id):
+        """Добавляет пользователя или снова включает рассылку, если он был неактивен"""
         with self.connection:
-            self.cursor.execute("INSERT INTO `users` (`user_id`) VALUES (?)", (user_id,))
+            self.cursor.execute("""
+                INSERT INTO `users` (`user_id`) VALUES (?)
+                ON CONFLICT(`user_id`) DO UPDATE SET `active` = 1, `deactivated_at` = NULL
+            """, (user_id,))
             return True
 
+    def deactivate_users(self, user_ids):
+        """Отключает рассылку пользователям, которым сообщения больше не доставляются"""
+        with self.connection:
+            self.cursor.executemany(
+                "UPDATE `users` SET `active` = 0, `deactivated_at` = CURRENT_TIMESTAMP WHERE `user_id` = ?",
+                [(user_id,) for user_id in user_ids]
+            )
+
     def delete_user(self, user_id):
         with self.connection:
             self.cursor.execute("DELETE FROM `users` WHERE `user_id` = ?", (user_id,))
             return True
 
-    def record_quiz_answer(self, user_id, is_correct, word):
-        """Записывает результат ответа на квиз"""
-        today = datetime.now().date()
+    def set_user_timezone(self, user_id, tz):
         with self.connection:
-            # Проверяем, есть ли запись на сегодня
-            existing = self.cursor.execute(
-                "SELECT id, correct_answers, total_answers FROM quiz_stats WHERE user_id = ? AND quiz_date = ?",
-                (user_id, today)
-            ).fetchone()
-            
-            if existing:
-                # Обновляем существующую запись
-                new_correct = existing[1] + (1 if is_correct else 0)
-                new_total = existing[2] + 1
-                self.cursor.execute(
-                    """UPDATE quiz_stats 
-                       SET correct_answers = ?, total_answers = ?, last_quiz_word = ?
-                       WHERE id = ?""",
-                    (new_correct, new_total, word, existing[0])
-                )
-            else:
-                # Создаем новую запись
-                self.cursor.execute(
-                    """INSERT INTO quiz_stats (user_id, quiz_date, correct_answers, total_answers, last_quiz_word)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (user_id, today, 1 if is_correct else 0, 1, word)
-                )
+            self.cursor.execute("UPDATE `users` SET `tz` = ? WHERE `user_id` = ?", (tz, user_id))
 
-    def get_user_stats(self, user_id):
-        """Получает статистику пользователя за сегодня"""
+    def get_user_timezone(self, user_id):
+        """Возвращает часовой пояс пользователя или None, если выбран пояс по умолчанию"""
+        with self.connection:
+            row = self.cursor.execute("SELECT `tz` FROM `users` WHERE `user_id` = ?", (user_id,)).fetchone()
+            return row[0] if row else None
+
+    def get_user_timezones(self):
+        """Возвращает часовые пояса активных пользователей (None — пояс по умолчанию)"""
+        with self.connection:
+            return [row[0] for row in self.cursor.execute("SELECT DISTINCT tz FROM users WHERE active = 1")]
+
+    def record_quiz_answer(self, user_id, is_correct, word):
+        """Записывает результат ответа на квиз одним атомарным запросом"""
         today = datetime.now().date()
         with self.connection:
-            result = self.cursor.execute(
-                """SELECT correct_answers, total_answers 
-                   FROM quiz_stats 
-                   WHERE user_id = ? AND quiz_date = ?""",
-                (user_id, today)
-            ).fetchone()
-            
-            if result:
-                return {
-                    "correct": result[0],
-                    "total": result[1],
-                    "accuracy": round((result[0] / result[1] * 100) if result[1] > 0 else 0, 1)
-                }
-            return {"correct": 0, "total": 0, "accuracy": 0.0}
+            self.cursor.execute("""
+                INSERT INTO quiz_stats (user_id, quiz_date, correct_answers, total_answers, last_quiz_word)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (user_id, quiz_date) DO UPDATE SET
+                    correct_answers = correct_answers + excluded.correct_answers,
+                    total_answers = total_answers + 1,
+                    last_quiz_word = excluded.last_quiz_word
+            """, (user_id, today, 1 if is_correct else 0, word))
+            # Итоговая статистика обновляется в той же транзакции
+            self.cursor.execute("""
+                INSERT INTO user_quiz_totals
+                    (user_id, correct_answers, total_answers, current_streak, best_streak, last_quiz_date)
+                VALUES (?, ?, 1, 1, 1, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    correct_answers = correct_answers + excluded.correct_answers,
+                    total_answers = total_answers + 1,
+                    current_streak = CASE
+                        WHEN last_quiz_date = excluded.last_quiz_date THEN current_streak
+                        WHEN last_quiz_date = date(excluded.last_quiz_date, '-1 day') THEN current_streak + 1
+                        ELSE 1 END,
+                    best_streak = MAX(best_streak, CASE
+                        WHEN last_quiz_date = excluded.last_quiz_date THEN current_streak
+                        WHEN last_quiz_date = date(excluded.last_quiz_date, '-1 day') THEN current_streak + 1
+                        ELSE 1 END),
+                    last_quiz_date = excluded.last_quiz_date
+            """, (user_id, 1 if is_correct else 0, today))
 
     def get_user_all_time_stats(self, user_id):
         """Получает общую статистику пользователя за все время"""
         with self.connection:
             result = self.cursor.execute(
-                """SELECT SUM(correct_answers), SUM(total_answers)
-                   FROM quiz_stats 
+                """SELECT correct_answers, total_answers, current_streak, best_streak, last_quiz_date
+                   FROM user_quiz_totals
                    WHERE user_id = ?""",
                 (user_id,)
             ).fetchone()
-            
-            if result and result[0]:
+
+            if result and result[1]:
+                # Серия прерывается, если вчера и сегодня ответов не было
+                last_day = datetime.strptime(result[4], "%Y-%m-%d").date()
+                streak = result[2] if (datetime.now().date() - last_day).days <= 1 else 0
                 return {
                     "correct": result[0],
                     "total": result[1],
-                    "accuracy": round((result[0] / result[1] * 100) if result[1] > 0 else 0, 1)
+                    "accuracy": round(result[0] / result[1] * 100, 1),
+                    "streak": streak,
+                    "best_streak": result[3],
                 }
-            return {"correct": 0, "total": 0, "accuracy": 0.0}
+            return {"correct": 0, "total": 0, "accuracy": 0.0, "streak": 0, "best_streak": 0}
 
-    def save_active_quiz(self, user_id, correct_word, original_sentence):
-        """Сохраняет активный квиз для пользователя"""
+    def create_quiz_instance(self, correct_word, original_sentence, options, correct_index):
+        """Сохраняет экземпляр квиза для рассылки и возвращает его id"""
         with self.connection:
             self.cursor.execute("""
-                INSERT OR REPLACE INTO active_quizzes (user_id, correct_word, original_sentence)
-                VALUES (?, ?, ?)
-            """, (user_id, correct_word, original_sentence))
+                INSERT INTO quiz_instances (correct_word, original_sentence, options, correct_index)
+                VALUES (?, ?, ?, ?)
+            """, (correct_word, original_sentence, json.dumps(options, ensure_ascii=False), correct_index))
+            return self.cursor.lastrowid
 
-    def get_active_quiz(self, user_id):
-        """Получает активный квиз для пользователя"""
+    def get_quiz_instance(self, quiz_id):
+        """Получает экземпляр квиза по id"""
         with self.connection:
             result = self.cursor.execute("""
-                SELECT correct_word, original_sentence 
-                FROM active_quizzes 
-                WHERE user_id = ?
-            """, (user_id,)).fetchone()
+                SELECT correct_word, original_sentence, options, correct_index
+                FROM quiz_instances
+                WHERE quiz_id = ?
+            """, (quiz_id,)).fetchone()
             if result:
-                return {"correct_word": result[0], "original_sentence": result[1]}
+                return {
+                    "quiz_id": quiz_id,
+                    "correct_word": result[0],
+                    "original_sentence": result[1],
+                    "options": json.loads(result[2]),
+                    "correct_index": result[3],
+                }
             return None
 
-    def delete_active_quiz(self, user_id):
-        """Удаляет активный квиз после ответа"""
+    def save_active_quizzes(self, rows):
+        """Сохраняет пачку активных квизов (user_id, quiz_id) одной транзакцией"""
+        with self.connection:
+            self.cursor.executemany("""
+                INSERT OR REPLACE INTO active_quizzes (user_id, quiz_id)
+                VALUES (?, ?)
+            """, rows)
+
+    def claim_active_quiz(self, user_id, quiz_id):
+        """Удаляет активный квиз при ответе; возвращает False, если на него уже ответили или он устарел"""
+        with self.connection:
+            self.cursor.execute("DELETE FROM active_quizzes WHERE user_id = ? AND quiz_id = ?", (user_id, quiz_id))
+            return self.cursor.rowcount > 0
+
+    def get_photo_file_id(self, image_path, content_hash):
+        """Получает file_id изображения, если файл не менялся с момента загрузки"""
+        with self.connection:
+            result = self.cursor.execute("""
+                SELECT file_id FROM photo_file_ids
+                WHERE image_path = ? AND content_hash = ?
+            """, (image_path, content_hash)).fetchone()
+            return result[0] if result else None
+
+    def save_photo_file_id(self, image_path, content_hash, file_id):
+        """Сохраняет file_id изображения и удаляет записи для старых версий файла"""
+        with self.connection:
+            self.cursor.execute("DELETE FROM photo_file_ids WHERE image_path = ?", (image_path,))
+            self.cursor.execute("""
+                INSERT INTO photo_file_ids (image_path, content_hash, file_id)
+                VALUES (?, ?, ?)
+            """, (image_path, content_hash, file_id))
+
+    def delete_photo_file_id(self, image_path):
+        """Удаляет file_id изображения (например, если Telegram его больше не принимает)"""
+        with self.connection:
+            self.cursor.execute("DELETE FROM photo_file_ids WHERE image_path = ?", (image_path,))
+
+    def consume_request_quota(self, user_id, day, limit):
+        """Атомарно увеличивает счётчик запросов, если лимит не исчерпан.
+
+        Возвращает (разрешено, текущее значение счётчика). Запрос выполняется
+        под блокировкой записи SQLite, поэтому корректен и для нескольких процессов.
+        """
+        with self.connection:
+            self.cursor.execute("""
+                INSERT INTO request_quota (user_id, day, count)
+                SELECT ?, ?, 1 WHERE ? > 0
+                ON CONFLICT (user_id, day) DO UPDATE SET count = count + 1
+                WHERE count < ?
+            """, (user_id, day, limit, limit))
+            allowed = self.cursor.rowcount > 0
+            count = self.cursor.execute(
+                "SELECT count FROM request_quota WHERE user_id = ? AND day = ?", (user_id, day)
+            ).fetchone()
+            return allowed, count[0] if count else 0
+
+    def get_request_count(self, user_id, day):
+        """Возвращает количество запросов пользователя за день"""
+        with self.connection:
+            result = self.cursor.execute(
+                "SELECT count FROM request_quota WHERE user_id = ? AND day = ?", (user_id, day)
+            ).fetchone()
+            return result[0] if result else 0
+
+    def purge_request_quota(self, before_day):
+        """Удаляет счётчики запросов за прошедшие дни"""
+        with self.connection:
+            self.cursor.execute("DELETE FROM request_quota WHERE day < ?", (before_day,))
+
+    def get_cached_response(self, cache_key, created_after):
+        """Возвращает сохранённый ответ ИИ, если он не старше created_after"""
+        with self.connection:
+            result = self.cursor.execute("""
+                SELECT response, created_at FROM ai_response_cache
+                WHERE cache_key = ? AND created_at > ?
+            """, (cache_key, created_after)).fetchone()
+            return result
+
+    def save_cached_response(self, cache_key, response, created_at):
+        """Сохраняет ответ ИИ в кэш"""
+        with self.connection:
+            self.cursor.execute("""
+                INSERT OR REPLACE INTO ai_response_cache (cache_key, response, created_at)
+                VALUES (?, ?, ?)
+            """, (cache_key, response, created_at))
+
+    def purge_cached_responses(self, created_before):
+        """Удаляет устаревшие ответы ИИ из кэша"""
+        with self.connection:
+            self.cursor.execute("DELETE FROM ai_response_cache WHERE created_at < ?", (created_before,))
+
+    def get_review_candidates(self, user_ids):
+        """Для каждого пользователя возвращает (слово с ближайшим повторением, его срок, next_new)"""
+        result = {}
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            values = ", ".join("(?)" for _ in chunk)
+            with self.connection:
+                rows = self.cursor.execute(f"""
+                    WITH batch(user_id) AS (VALUES {values})
+                    SELECT b.user_id,
+                           (SELECT r.item FROM review_state r WHERE r.user_id = b.user_id
+                            ORDER BY r.next_review LIMIT 1),
+                           (SELECT MIN(r.next_review) FROM review_state r WHERE r.user_id = b.user_id),
+                           COALESCE(p.next_new, 0)
+                    FROM batch b LEFT JOIN srs_progress p ON p.user_id = b.user_id
+                """, chunk).fetchall()
+            for user_id, item, next_review, next_new in rows:
+                result[user_id] = (item, next_review, next_new)
+        return result
+
+    def introduce_review_items(self, rows):
+        """Сохраняет пачку впервые отправленных слов: строки (user_id, item, next_review, next_new)"""
+        with self.connection:
+            self.cursor.executemany(
+                "INSERT OR IGNORE INTO review_state (user_id, item, next_review) VALUES (?, ?, ?)",
+                [row[:3] for row in rows]
+            )
+            self.cursor.executemany("""
+                INSERT INTO srs_progress (user_id, next_new) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET next_new = MAX(next_new, excluded.next_new)
+            """, [(row[0], row[3]) for row in rows])
+
+    def get_seen_words(self, user_ids):
+        """Возвращает {user_id: seen} для пользователей, которым уже отправлялись слова дня"""
+        result = {}
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            with self.connection:
+                result.update(self.cursor.execute(
+                    f"SELECT user_id, seen FROM word_progress WHERE user_id IN ({placeholders})", chunk
+                ).fetchall())
+        return result
+
+    def save_seen_words(self, rows):
+        """Сохраняет пачку строк (user_id, seen)"""
+        with self.connection:
+            self.cursor.executemany("""
+                INSERT INTO word_progress (user_id, seen) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET seen = excluded.seen
+            """, rows)
+
+    def record_review(self, user_id, item, review):
+        """Обновляет состояние повторения слова.
+
+        review(easiness, interval, repetitions) возвращает (easiness, interval, repetitions, next_review).
+        """
+        with self.connection:
+            row = self.cursor.execute(
+                "SELECT easiness, interval, repetitions FROM review_state WHERE user_id = ? AND item = ?",
+                (user_id, item)
+            ).fetchone()
+            state = review(*(row or (2.5, 0, 0)))
+            self.cursor.execute("""
+                INSERT INTO review_state (user_id, item, easiness, interval, repetitions, next_review)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(user_id, item) DO UPDATE SET
+                    easiness = excluded.easiness,
+                    interval = excluded.interval,
+                    repetitions = excluded.repetitions,
+                    next_review = excluded.next_review
+            """, (user_id, item, *state))
+            return state
+
+    def get_fsm_record(self, storage_key, updated_after):
+        """Возвращает (state, data, updated_at) или None, если записи нет или она устарела"""
+        with self.connection:
+            row = self.cursor.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE storage_key = ? AND updated_at >= ?",
+                (storage_key, updated_after)
+            ).fetchone()
+        return (row[0], json.loads(row[1]), row[2]) if row else None
+
+    def save_fsm_records(self, rows):
+        """Сохраняет пачку состояний: строки (storage_key, state, data, updated_at).
+
+        Пустые состояния (без state и data) удаляются.
+        """
+        with self.connection:
+            self.cursor.executemany(
+                "DELETE FROM fsm_states WHERE storage_key = ?",
+                [(key,) for key, state, data, _ in rows if state is None and not data]
+            )
+            self.cursor.executemany("""
+                INSERT INTO fsm_states (storage_key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(storage_key) DO UPDATE SET
+                    state = excluded.state,
+                    data = excluded.data,
+                    updated_at = excluded.updated_at
+            """, [
+                (key, state, json.dumps(data, ensure_ascii=False), updated_at)
+                for key, state, data, updated_at in rows if state is not None or data
+            ])
+
+    def purge_fsm_records(self, updated_before):
+        with self.connection:
+            self.cursor.execute("DELETE FROM fsm_states WHERE updated_at < ?", (updated_before,))
+            return self.cursor.rowcount
+
+    def create_broadcast_job(self, job_id, kind, payload):
+        """Создает задание рассылки; возвращает False, если задание с таким id уже есть"""
+        with self.connection:
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO broadcast_jobs (job_id, kind, payload) VALUES (?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False))
+            )
+            return self.cursor.rowcount > 0
+
+    def get_broadcast_job(self, job_id):
+        """Возвращает (kind, payload) задания или None"""
+        with self.connection:
+            row = self.cursor.execute(
+                "SELECT kind, payload FROM broadcast_jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def enqueue_broadcast_recipients(self, job_id, tz=None, all_timezones=True, slots=1, first_slot=0, last_slot=0):
+        """Добавляет в рассылку активных пользователей пояса tz из слотов first_slot..last_slot.
+
+        Слот пользователя — user_id % slots. Уже добавленные пользователи
+        пропускаются, поэтому повторный вызов ничего не меняет.
+        Возвращает число добавленных получателей.
+        """
+        tz_filter = "" if all_timezones else "AND tz IS ?"
+        params = (job_id,) + (() if all_timezones else (tz,)) + (slots, first_slot, last_slot)
+        with self.connection:
+            self.cursor.execute(f"""
+                INSERT OR IGNORE INTO broadcast_deliveries (job_id, user_id)
+                SELECT ?, user_id FROM users
+                WHERE active = 1 {tz_filter} AND user_id % ? BETWEEN ? AND ?
+            """, params)
+            added = self.cursor.rowcount
+            if added:
+                self.cursor.execute("UPDATE broadcast_jobs SET status = 'running' WHERE job_id = ?", (job_id,))
+            return added
+
+    def get_unfinished_broadcast_jobs(self):
+        """Возвращает незавершенные рассылки как (job_id, kind, payload)"""
+        with self.connection:
+            rows = self.cursor.execute(
+                "SELECT job_id, kind, payload FROM broadcast_jobs WHERE status = 'running' ORDER BY created_at"
+            ).fetchall()
+        return [(job_id, kind, json.loads(payload)) for job_id, kind, payload in rows]
+
+    def reset_interrupted_deliveries(self, job_id):
+        """Помечает как unknown получателей, отправка которым прервалась падением процесса"""
+        with self.connection:
+            self.cursor.execute(
+                "UPDATE broadcast_deliveries SET status = 'unknown' WHERE job_id = ? AND status = 'sending'",
+                (job_id,)
+            )
+            return self.cursor.rowcount
+
+    def claim_broadcast_recipients(self, job_id, limit):
+        """Берет в работу следующую пачку ожидающих получателей (помечает их как sending)"""
+        with self.connection:
+            user_ids = [user_id for user_id, in self.cursor.execute("""
+                SELECT user_id FROM broadcast_deliveries INDEXED BY idx_broadcast_pending
+                WHERE job_id = ? AND status = 'pending'
+                ORDER BY user_id LIMIT ?
+            """, (job_id, limit))]
+            if user_ids:
+                self.cursor.executemany(
+                    "UPDATE broadcast_deliveries SET status = 'sending' WHERE job_id = ? AND user_id = ?",
+                    [(job_id, user_id) for user_id in user_ids]
+                )
+            return user_ids
+
+    def mark_deliveries(self, rows):
+        """Сохраняет пачку статусов доставки: строки (status, job_id, user_id)"""
+        with self.connection:
+            self.cursor.executemany(
+                "UPDATE broadcast_deliveries SET status = ? WHERE job_id = ? AND user_id = ?", rows
+            )
+
+    def finish_broadcast_job(self, job_id, keep_days=7):
+        """Завершает рассылку, если в ней не осталось ожидающих получателей.
+
+        Заодно удаляет журналы доставки старых рассылок. Возвращает True, если рассылка завершена.
+        """
         with self.connection:
-            self.cursor.execute("DELETE FROM active_quizzes WHERE user_id = ?", (user_id,))
+            self.cursor.execute("""
+                UPDATE broadcast_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP
+                WHERE job_id = ? AND NOT EXISTS (
+                    SELECT 1 FROM broadcast_deliveries WHERE job_id = ? AND status = 'pending'
+                )
+            """, (job_id, job_id))
+            if self.cursor.rowcount == 0:
+                return False
+            self.cursor.execute("""
+                DELETE FROM broadcast_deliveries WHERE job_id IN (
+                    SELECT job_id FROM broadcast_jobs
+                    WHERE status = 'done' AND finished_at < datetime('now', ?)
+                )
+            """, (f"-{keep_days} days",))
+            return True
+
+    def get_broadcast_job_summary(self, job_id):
+        """Возвращает число получателей рассылки по статусам"""
+        with self.connection:
+            return dict(self.cursor.execute(
+                "SELECT status, COUNT(*) FROM broadcast_deliveries WHERE job_id = ? GROUP BY status",
+                (job_id,)
+            ).fetchall())
 
     def close(self):
         self.connection.close()
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database, не блокирующий event loop.
+
+    Все запросы выполняются по очереди в одном выделенном потоке, который
+    владеет соединением с SQLite. Методы совпадают с методами Database,
+    но возвращают корутины.
+    """
+
+    def __init__(self, db_file):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.db = self.executor.submit(Database, db_file).result()
+
+    async def run(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(getattr(self.db, method), *args, **kwargs)
+        with DB_QUERY_DURATION.labels(method).time():
+            return await loop.run_in_executor(self.executor, call)
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.__dict__.get("db"), name, None)):
+            raise AttributeError(name)
+        return functools.partial(self.run, name)
+
+    async def close(self):
+        await self.run("close")
+        self.executor.shutdown(wait=True)
+
+
+class BatchWriter:
+    """Накапливает строки и записывает их пачками.
+
+    Пачка записывается, когда набирается batch_size строк, раз в interval
+    секунд и при выходе из блока async with — так при падении процесса
+    теряется не больше одного интервала, а fsync делается один раз на пачку.
+    """
+
+    def __init__(self, write, batch_size=DB_BATCH_SIZE, interval=DB_FLUSH_INTERVAL):
+        self.write = write
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = []
+        self.lock = asyncio.Lock()
+        self.stopping = None
+        self.task = None
+
+    async def __aenter__(self):
+        self.stopping = asyncio.Event()
+        self.task = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        # Цикл не отменяется, а останавливается: начатая им запись доходит до конца
+        self.stopping.set()
+        await self.task
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    async def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.rows:
+                return
+            rows, self.rows = self.rows, []
+            write = asyncio.ensure_future(self.write(rows))
+            try:
+                # Отмена вызывающей задачи не прерывает запись, уже отправленную в поток БД
+                await asyncio.shield(write)
+            except asyncio.CancelledError:
+                write.add_done_callback(lambda done: self._requeue_failed(rows, done))
+                raise
+            except Exception:
+                self._requeue_failed(rows, write)
+
+    def _requeue_failed(self, rows, write):
+        """Возвращает строки неудавшейся записи в начало очереди, чтобы записать их следующей пачкой"""
+        if not write.cancelled() and write.exception() is None:
+            return
+        logging.error(f"❌ Ошибка пакетной записи в БД ({len(rows)} строк): "
+                      f"{'запись отменена' if write.cancelled() else write.exception()}")
+        self.rows[:0] = rows
@@ -0,0 +1,133 @@
+import random
+from collections import defaultdict
+
+from content import content
+
+# Слоги хангыля U+AC00–U+D7A3: (начальная × 21 + средняя) × 28 + конечная
+HANGUL_BASE = 0xAC00
+HANGUL_LAST = 0xD7A3
+
+
+def decompose(text):
+    """Раскладывает слоги хангыля на чамо: 학교 → ㅎㅏㄱㄱㅛ"""
+    jamo = []
+    for char in text:
+        code = ord(char) - HANGUL_BASE
+        if 0 <= code <= HANGUL_LAST - HANGUL_BASE:
+            jamo.append(chr(0x1100 + code // 588))
+            jamo.append(chr(0x1161 + code % 588 // 28))
+            if code % 28:
+                jamo.append(chr(0x11A7 + code % 28))
+        else:
+            jamo.append(char)
+    return "".join(jamo)
+
+
+def edit_distance(a, b):
+    """Расстояние Левенштейна"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def part_of_speech(word):
+    """Грубая часть речи: словарная форма глаголов и прилагательных оканчивается на 다"""
+    return "verb" if word.endswith("다") and len(word) > 1 else "noun"
+
+
+class DistractorIndex:
+    """Похожие слова для неправильных вариантов, посчитанные один раз при загрузке.
+
+    Кандидаты для слова ищутся среди слов той же части речи и близкой длины
+    в слогах и ранжируются по расстоянию между разложениями на чамо. Для
+    каждого слова хранится top_k кандидатов, поэтому выбор вариантов при
+    отправке квиза — это random.sample из короткого списка.
+    """
+
+    def __init__(self, words, top_k=8):
+        self.words = {word.word: word for word in words}
+        self.top_k = top_k
+        self.candidates = self._build()
+
+    def _build(self):
+        groups = defaultdict(list)
+        for word in self.words.values():
+            groups[part_of_speech(word.word), len(word.word)].append(word)
+        jamo = {word: decompose(word) for word in self.words}
+        longest = max(map(len, self.words), default=0)
+
+        candidates = {}
+        # Достаточно сравнить слово с несколькими top_k ближайших по длине и части речи
+        pool_size = self.top_k * 4
+        for word, data in self.words.items():
+            pos, length = part_of_speech(word), len(word)
+            pool = []
+            for delta in range(longest + 1):
+                for other_pos in (pos, "noun" if pos == "verb" else "verb"):
+                    for size in {length - delta, length + delta}:
+                        pool.extend(groups.get((other_pos, size), ()))
+                    if len(pool) >= pool_size:
+                        break
+                if len(pool) >= pool_size:
+                    break
+            scored = []
+            for other in pool:
+                # Слово с тем же переводом тоже было бы правильным ответом
+                if other.word == word or other.translation == data.translation:
+                    continue
+                score = (
+                    edit_distance(jamo[word], jamo[other.word])
+                    + 2 * abs(len(other.word) - length)
+                    + (0 if part_of_speech(other.word) == pos else 4)
+                )
+                scored.append((score, other.word))
+            scored.sort()
+            candidates[word] = tuple(dict.fromkeys(other for _, other in scored))[:self.top_k]
+        return candidates
+
+    def sample(self, word, count=3, rng=random):
+        """До count неправильных вариантов для слова (меньше, если в словаре мало слов)"""
+        candidates = self.candidates.get(word, ())
+        return rng.sample(candidates, min(count, len(candidates)))
+
+    def quiz(self, word_data, rng=random):
+        """Простой квиз с пропуском для слова из words.json"""
+        options = [word_data.word, *self.sample(word_data.word, rng=rng)]
+        rng.shuffle(options)
+        return {
+            "sentence": "나는 ______을(를) 좋아해요.",
+            "original_sentence": f"나는 {word_data.word}을(를) 좋아해요.",
+            "options": options,
+            "correct_index": options.index(word_data.word),
+            "correct_word": word_data.word,
+            "translation": word_data.translation,
+        }
+
+    def quizzes(self, rng=random):
+        """Квизы сразу для всех слов словаря"""
+        return [self.quiz(word_data, rng) for word_data in self.words.values()]
+
+
+class Distractors:
+    """DistractorIndex для текущего словаря; перестраивается, когда words.json перечитан"""
+
+    def __init__(self, repository=content):
+        self.content = repository
+        self.source = None
+        self.index = None
+
+    def get(self):
+        self.content.refresh()
+        if self.content.words is not self.source:
+            self.source = self.content.words
+            self.index = DistractorIndex(self.source)
+        return self.index
+
+
+distractors = Distractors()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from configuration import FSM_CACHE_SIZE, FSM_CACHE_FRESHNESS, FSM_FLUSH_INTERVAL, FSM_STATE_TTL
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний диалогов: таблица fsm_states и LRU в памяти перед ней.
+
+    Изменения копятся в pending и записываются пачкой раз в flush_interval;
+    чтение сначала смотрит в pending, поэтому всегда видит свои записи.
+    Запись в LRU считается актуальной freshness секунд — потом состояние
+    перечитывается из базы, так как его мог изменить другой процесс.
+    Состояния, не менявшиеся дольше ttl секунд, считаются пустыми и
+    периодически удаляются из базы.
+    """
+
+    def __init__(self, db, max_size=FSM_CACHE_SIZE, freshness=FSM_CACHE_FRESHNESS,
+                 flush_interval=FSM_FLUSH_INTERVAL, ttl=FSM_STATE_TTL):
+        self.db = db
+        self.max_size = max_size
+        self.freshness = freshness
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.cache = OrderedDict()  # ключ -> (state, data, updated_at, прочитано в monotonic)
+        self.pending = {}           # ключ -> (state, data, updated_at)
+        self.flushing = {}          # пачка, которая сейчас записывается
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.closing = None
+        self.last_purge = 0.0
+
+    @staticmethod
+    def _key(key):
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _remember(self, storage_key, state, data, updated_at):
+        self.cache[storage_key] = (state, data, updated_at, time.monotonic())
+        self.cache.move_to_end(storage_key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    async def _get(self, key):
+        storage_key = self._key(key)
+        now = time.time()
+        record = self.pending.get(storage_key) or self.flushing.get(storage_key)
+        if record is None:
+            cached = self.cache.get(storage_key)
+            if cached is not None and time.monotonic() - cached[3] < self.freshness:
+                self.cache.move_to_end(storage_key)
+                record = cached[:3]
+            else:
+                row = await self.db.get_fsm_record(storage_key, now - self.ttl)
+                # Пока шло чтение, состояние могли изменить в этом процессе
+                record = self.pending.get(storage_key) or self.flushing.get(storage_key)
+                if record is None:
+                    record = row or (None, {}, now)
+                    self._remember(storage_key, *record)
+        state, data, updated_at = record
+        if now - updated_at > self.ttl:
+            return storage_key, None, {}
+        return storage_key, state, data
+
+    async def _put(self, storage_key, state, data):
+        updated_at = time.time()
+        self.pending[storage_key] = (state, data, updated_at)
+        self._remember(storage_key, state, data, updated_at)
+        if self.task is None or self.task.done():
+            if self.closing is None:
+                self.closing = asyncio.Event()
+            self.task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while self.pending and not self.closing.is_set():
+            try:
+                await asyncio.wait_for(self.closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
+
+    def _requeue(self, rows):
+        # Возвращаем в очередь то, что не успели перезаписать новыми изменениями
+        for key, record in rows.items():
+            self.pending.setdefault(key, record)
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            rows = self.flushing = self.pending
+            self.pending = {}
+            try:
+                await self.db.save_fsm_records([(key, *record) for key, record in rows.items()])
+            except asyncio.CancelledError:
+                self._requeue(rows)
+                raise
+            except Exception as e:
+                logging.error(f"❌ Ошибка записи состояний FSM ({len(rows)} строк): {e}")
+                self._requeue(rows)
+                return
+            finally:
+                self.flushing = {}
+            if time.monotonic() - self.last_purge > self.ttl / 24:
+                self.last_purge = time.monotonic()
+                await self.db.purge_fsm_records(time.time() - self.ttl)
+
+    async def set_state(self, key, state=None):
+        storage_key, _, data = await self._get(key)
+        await self._put(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        _, state, _ = await self._get(key)
+        return state
+
+    async def set_data(self, key, data):
+        storage_key, state, _ = await self._get(key)
+        await self._put(storage_key, state, data.copy())
+
+    async def get_data(self, key):
+        _, _, data = await self._get(key)
+        return data.copy()
+
+    async def close(self):
+        # Цикл записи останавливается, а не отменяется: пачка, которая сейчас пишется, не теряется
+        if self.task is not None:
+            self.closing.set()
+            await self.task
+        await self.flush()
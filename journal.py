@@ -0,0 +1,59 @@
+import logging
+
+from configuration import BROADCAST_CHECKPOINT_SIZE
+from db import BatchWriter
+
+
+class BroadcastJournal:
+    """Журнал рассылок: задания и статус доставки каждому получателю.
+
+    Получатели берутся в работу пачками по chunk_size: перед отправкой пачка
+    помечается как sending — это и есть контрольная точка. Статусы
+    sent/failed/blocked записываются пачками через BatchWriter. После падения процесса
+    рассылка продолжается с получателей в статусе pending, а оставшиеся в
+    статусе sending, повторно не отправляются — лучше пропустить сообщение,
+    чем прислать его дважды.
+    """
+
+    def __init__(self, db, chunk_size=BROADCAST_CHECKPOINT_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+
+    async def create(self, job_id, kind, payload):
+        """Создает задание; возвращает False, если оно уже было"""
+        return await self.db.create_broadcast_job(job_id, kind, payload)
+
+    async def get(self, job_id):
+        """Возвращает (kind, payload) задания или None"""
+        return await self.db.get_broadcast_job(job_id)
+
+    async def enqueue(self, job_id, **recipients):
+        """Добавляет получателей (см. Database.enqueue_broadcast_recipients)"""
+        return await self.db.enqueue_broadcast_recipients(job_id, **recipients)
+
+    async def recipient_batches(self, job_id):
+        """Асинхронно выдает пачки получателей, которым сообщение еще не отправлялось"""
+        while True:
+            user_ids = await self.db.claim_broadcast_recipients(job_id, self.chunk_size)
+            if not user_ids:
+                return
+            yield user_ids
+
+    def recorder(self):
+        """BatchWriter для строк (status, job_id, user_id)"""
+        return BatchWriter(self.db.mark_deliveries)
+
+    async def unfinished(self):
+        """Возвращает рассылки, прерванные падением процесса, и готовит их к продолжению"""
+        jobs = await self.db.get_unfinished_broadcast_jobs()
+        for job_id, _, _ in jobs:
+            interrupted = await self.db.reset_interrupted_deliveries(job_id)
+            if interrupted:
+                logging.warning(f"⚠️ Рассылка {job_id}: {interrupted} получателей с неизвестным статусом пропущено")
+        return jobs
+
+    async def finish(self, job_id):
+        """Завершает задание; возвращает итог по статусам или None, если остались получатели"""
+        if not await self.db.finish_broadcast_job(job_id):
+            return None
+        return await self.db.get_broadcast_job_summary(job_id)
@@ -0,0 +1,57 @@
+"""Служебные команды бота.
+
+    python manage.py backfill-stats    # пересчитать итоговую статистику по истории квизов
+    python manage.py build-assets      # подготовить изображения слов для отправки в Telegram
+"""
+import argparse
+import json
+import time
+
+from assets import build_assets
+from configuration import DATABASE_PATH, ASSET_MAX_SIZE, ASSET_JPEG_QUALITY
+from db import Database
+
+
+def backfill_stats(args):
+    db = Database(DATABASE_PATH)
+    users = db.backfill_quiz_totals()
+    db.close()
+    print(f"✅ Итоговая статистика пересчитана для {users} пользователей")
+
+
+def build_assets_command(args):
+    with open(args.words, encoding="utf-8") as f:
+        sources = [entry["image"] for entry in json.load(f) if isinstance(entry, dict) and "image" in entry]
+    started = time.perf_counter()
+    manifest, rebuilt = build_assets(sources, max_size=args.max_size, quality=args.quality,
+                                     workers=args.workers, force=args.force)
+    images = manifest["images"].values()
+    source_bytes = sum(entry["source_bytes"] for entry in images)
+    asset_bytes = sum(entry["bytes"] for entry in images)
+    print(
+        f"✅ Изображений в манифесте: {len(manifest['images'])}, пересобрано: {rebuilt} "
+        f"за {time.perf_counter() - started:.1f} с; "
+        f"размер {source_bytes / 1024 / 1024:.1f} МБ → {asset_bytes / 1024 / 1024:.1f} МБ"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды бота")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("backfill-stats", help="пересчитать user_quiz_totals по quiz_stats").set_defaults(func=backfill_stats)
+
+    assets = commands.add_parser("build-assets", help="подготовить изображения слов (assets/manifest.json)")
+    assets.add_argument("--words", default="words.json", help="словарь с путями к изображениям")
+    assets.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    assets.add_argument("--max-size", type=int, default=ASSET_MAX_SIZE, help="наибольшая сторона в пикселях")
+    assets.add_argument("--quality", type=int, default=ASSET_JPEG_QUALITY, help="качество JPEG")
+    assets.add_argument("--force", action="store_true", help="пересобрать все изображения")
+    assets.set_defaults(func=build_assets_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
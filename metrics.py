@@ -0,0 +1,215 @@
+import logging
+import time
+from bisect import bisect_left
+
+from aiogram import BaseMiddleware
+
+# Границы гистограмм длительности в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """Метрика с метками: значения хранятся отдельно для каждого набора меток"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.value:g}"]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), child.counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else f"{bound:g}"
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, [('le', le)])} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum:g}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Метрики бота
+HANDLER_DURATION = Histogram("bot_handler_duration_seconds", "Время обработки обновления обработчиком", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+DB_QUERY_DURATION = Histogram("bot_db_query_duration_seconds", "Время запроса к базе с ожиданием очереди", ("query",))
+AI_IN_FLIGHT = Gauge("bot_ai_in_flight", "Запросы к модели, выполняющиеся сейчас")
+AI_REQUEST_DURATION = Histogram("bot_ai_request_duration_seconds", "Длительность запроса к модели", ("result",))
+AI_FIRST_TOKEN = Histogram("bot_ai_first_token_seconds", "Время до первого фрагмента ответа модели")
+AI_RETRIES = Counter("bot_ai_retries_total", "Повторы запросов к модели после временных ошибок")
+AI_CACHE_LOOKUPS = Counter("bot_ai_cache_lookups_total", "Обращения к кэшу ответов ИИ", ("result",))
+BROADCAST_MESSAGES = Counter("bot_broadcast_messages_total", "Сообщения рассылок", ("broadcast", "result"))
+BROADCAST_RETRIES = Counter("bot_broadcast_retries_total", "Повторы отправки в рассылках", ("broadcast",))
+BROADCAST_FLOOD_WAITS = Counter("bot_broadcast_flood_waits_total", "Ответы RetryAfter во время рассылок", ("broadcast",))
+OUTBOUND_QUEUE_DEPTH = Gauge("bot_outbound_queue_depth", "Запросы к Bot API, ждущие свободного соединения", ("lane",))
+OUTBOUND_WAIT = Histogram("bot_outbound_wait_seconds", "Ожидание соединения запросом к Bot API", ("lane",))
+OUTBOUND_IN_FLIGHT = Gauge("bot_outbound_in_flight", "Запросы к Bot API, выполняющиеся сейчас", ("lane",))
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Измеряет время и считает ошибки каждого обработчика"""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            HANDLER_DURATION.labels(name).observe(time.perf_counter() - started)
+
+
+async def start_metrics_server(host, port):
+    """Запускает HTTP-сервер с /metrics; возвращает AppRunner для остановки.
+
+    Если порт занят, бот продолжает работу без метрик и возвращается None.
+    """
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logging.error(f"❌ Не удалось открыть порт метрик {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logging.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
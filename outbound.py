@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.client.telegram import TelegramAPIServer
+
+from configuration import BOT_TOKEN, TELEGRAM_API_URL, OUTBOUND_MAX_CONNECTIONS, OUTBOUND_INTERACTIVE_RESERVE
+from metrics import OUTBOUND_QUEUE_DEPTH, OUTBOUND_WAIT, OUTBOUND_IN_FLIGHT
+
+# Полосы исходящих запросов в порядке приоритета
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Полоса запросов текущей задачи; рассылки переключаются на BULK
+lane = ContextVar("outbound_lane", default=INTERACTIVE)
+
+
+def create_session(max_connections=OUTBOUND_MAX_CONNECTIONS):
+    """Сессия Bot API; с TELEGRAM_API_URL запросы идут на указанный сервер"""
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL.rstrip("/")))
+    else:
+        session = AiohttpSession()
+    # По умолчанию aiohttp держит не больше 100 соединений
+    session._connector_init["limit"] = max_connections
+    return session
+
+
+class PriorityGate:
+    """Ограничивает число одновременных запросов к Bot API с приоритетом полос.
+
+    Когда все соединения заняты, освободившееся соединение достаётся
+    сначала ожидающим интерактивным запросам. Массовым запросам никогда
+    не отдаются последние reserve соединений, поэтому ответ пользователю
+    не ждёт, пока рассылка освободит пул.
+    """
+
+    def __init__(self, limit=OUTBOUND_MAX_CONNECTIONS, reserve=OUTBOUND_INTERACTIVE_RESERVE):
+        self.limit = limit
+        self.bulk_limit = max(1, limit - reserve)
+        self.active = dict.fromkeys(LANES, 0)
+        self.waiters = {name: deque() for name in LANES}
+
+    def _can_start(self, name):
+        if sum(self.active.values()) >= self.limit:
+            return False
+        return name != BULK or self.active[BULK] < self.bulk_limit
+
+    async def acquire(self, name):
+        # Без очереди проходят, только если никто с тем же или более высоким приоритетом не ждёт
+        ahead = LANES[:LANES.index(name) + 1]
+        if not any(self.waiters[other] for other in ahead) and self._can_start(name):
+            self._start(name)
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[name].append(future)
+        OUTBOUND_QUEUE_DEPTH.labels(name).inc()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Соединение уже передано этому запросу — возвращаем его
+                self.release(name)
+            elif future in self.waiters[name]:
+                self.waiters[name].remove(future)
+                OUTBOUND_QUEUE_DEPTH.labels(name).dec()
+            raise
+
+    def _start(self, name):
+        self.active[name] += 1
+        OUTBOUND_IN_FLIGHT.labels(name).inc()
+
+    def release(self, name):
+        self.active[name] -= 1
+        OUTBOUND_IN_FLIGHT.labels(name).dec()
+        for other in LANES:
+            waiters = self.waiters[other]
+            while waiters and self._can_start(other):
+                future = waiters.popleft()
+                OUTBOUND_QUEUE_DEPTH.labels(other).dec()
+                if not future.done():
+                    self._start(other)
+                    future.set_result(None)
+
+
+class LaneMiddleware(BaseRequestMiddleware):
+    """Пропускает каждый запрос к Bot API через PriorityGate по полосе из контекста"""
+
+    def __init__(self, gate):
+        self.gate = gate
+
+    async def __call__(self, make_request, bot, method):
+        name = lane.get()
+        started = time.perf_counter()
+        await self.gate.acquire(name)
+        OUTBOUND_WAIT.labels(name).observe(time.perf_counter() - started)
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.gate.release(name)
+
+
+# Один бот и один пул соединений на процесс: и для ответов пользователям, и для рассылок
+gate = PriorityGate()
+bot = Bot(token=BOT_TOKEN, session=create_session(), default=DefaultBotProperties(parse_mode='HTML'))
+bot.session.middleware(LaneMiddleware(gate))
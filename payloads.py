@@ -0,0 +1,50 @@
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from quiz_store import encode_answer
+
+
+class QuizPayload:
+    """Сообщение квиза, собранное один раз на рассылку.
+
+    Текст и клавиатура одинаковы для всех получателей (в кнопках нет
+    данных пользователя), поэтому для каждого отличается только chat_id.
+    """
+
+    def __init__(self, quiz, quiz_id):
+        self.quiz_id = quiz_id
+        self.text = (
+            f"<b>Ежедневный квиз</b>\n\n"
+            f"📝 <b>Заполните пропуск:</b>\n\n"
+            f"{quiz['sentence']}\n"
+            f"<i>({quiz['translation']})</i>"
+        )
+        # Создаем инлайн-кнопки с вариантами ответов
+        self.reply_markup = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=option, callback_data=encode_answer(quiz_id, i))]
+            for i, option in enumerate(quiz["options"])
+        ])
+
+    async def send(self, bot, chat_id):
+        return await bot.send_message(
+            chat_id=chat_id,
+            text=self.text,
+            reply_markup=self.reply_markup,
+            parse_mode="HTML"
+        )
+
+
+class WordPayload:
+    """Слово дня, собранное один раз на рассылку"""
+
+    def __init__(self, word_data, photo_cache):
+        self.photo_cache = photo_cache
+        self.image = word_data.image
+        self.caption = (
+            f"<b>Слово дня:</b> {word_data.word}\n"
+            f"<b>Перевод:</b> {word_data.translation}\n"
+            f"✏️ <b>Пример:</b> {word_data.example}"
+        )
+
+    async def send(self, bot, chat_id):
+        # Изображение загружается один раз, дальше отправляется по file_id
+        return await self.photo_cache.send_photo(bot, chat_id, self.image, caption=self.caption, parse_mode="HTML")
@@ -0,0 +1,71 @@
+import asyncio
+import hashlib
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+
+class PhotoCache:
+    """Кэш file_id изображений, загруженных в Telegram.
+
+    Каждое изображение загружается один раз, дальше отправляется по file_id.
+    Ключ — путь к файлу и хэш его содержимого, поэтому изменённый файл
+    загружается заново.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.hashes = {}    # путь -> (mtime, размер, хэш)
+        self.file_ids = {}  # (путь, хэш) -> file_id
+        self.locks = {}
+
+    def file_hash(self, image_path):
+        stat = os.stat(image_path)
+        cached = self.hashes.get(image_path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        with open(image_path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        self.hashes[image_path] = (stat.st_mtime_ns, stat.st_size, content_hash)
+        return content_hash
+
+    async def get(self, image_path):
+        key = (image_path, self.file_hash(image_path))
+        if key not in self.file_ids:
+            file_id = await self.db.get_photo_file_id(*key)
+            if file_id is None:
+                return None
+            self.file_ids[key] = file_id
+        return self.file_ids[key]
+
+    async def save(self, image_path, file_id):
+        key = (image_path, self.file_hash(image_path))
+        await self.db.save_photo_file_id(*key, file_id)
+        self.file_ids[key] = file_id
+
+    async def forget(self, image_path):
+        await self.db.delete_photo_file_id(image_path)
+        self.file_ids = {key: value for key, value in self.file_ids.items() if key[0] != image_path}
+
+    async def send_photo(self, bot, chat_id, image_path, **kwargs):
+        """Отправляет изображение по file_id, а если его ещё нет — загружает файл"""
+        file_id = await self.get(image_path)
+        if file_id:
+            try:
+                return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if "file" not in str(e).lower():
+                    raise
+                # Telegram больше не знает этот file_id — загружаем файл заново
+                await self.forget(image_path)
+
+        # Пока идёт первая загрузка, остальные отправки ждут её file_id,
+        # а отправляют уже без блокировки — иначе они шли бы по одной
+        async with self.locks.setdefault(image_path, asyncio.Lock()):
+            file_id = await self.get(image_path)
+            if not file_id:
+                message = await bot.send_photo(chat_id=chat_id, photo=FSInputFile(image_path), **kwargs)
+                await self.save(image_path, message.photo[-1].file_id)
+                return message
+        return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
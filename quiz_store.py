@@ -0,0 +1,67 @@
+import base64
+import binascii
+import struct
+from collections import OrderedDict
+
+from configuration import QUIZ_CACHE_SIZE
+
+# callback_data ответа на квиз: префикс и base64 от (id экземпляра квиза, номер варианта) —
+# 9 байт вместо слова в UTF-8, которое могло не поместиться в лимит Telegram в 64 байта
+QUIZ_CALLBACK_PREFIX = "q:"
+_ANSWER = struct.Struct(">IB")
+
+
+def encode_answer(quiz_id, option_index):
+    token = base64.urlsafe_b64encode(_ANSWER.pack(quiz_id, option_index)).rstrip(b"=")
+    return QUIZ_CALLBACK_PREFIX + token.decode("ascii")
+
+
+def decode_answer(callback_data):
+    """Возвращает (quiz_id, option_index) или None, если данные повреждены"""
+    token = callback_data[len(QUIZ_CALLBACK_PREFIX):]
+    try:
+        return _ANSWER.unpack(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, struct.error, ValueError):
+        return None
+
+
+class QuizInstanceStore:
+    """Экземпляры квизов: таблица quiz_instances и LRU в памяти перед ней.
+
+    Экземпляр не меняется после создания, поэтому кэш безопасен и при
+    нескольких процессах — при промахе экземпляр читается из базы.
+    """
+
+    def __init__(self, db, max_size=QUIZ_CACHE_SIZE):
+        self.db = db
+        self.max_size = max_size
+        self.instances = OrderedDict()
+
+    def _remember(self, quiz):
+        self.instances[quiz["quiz_id"]] = quiz
+        self.instances.move_to_end(quiz["quiz_id"])
+        while len(self.instances) > self.max_size:
+            self.instances.popitem(last=False)
+
+    async def create(self, quiz):
+        quiz_id = await self.db.create_quiz_instance(
+            quiz["correct_word"], quiz["original_sentence"], quiz["options"], quiz["correct_index"]
+        )
+        self._remember({
+            "quiz_id": quiz_id,
+            "correct_word": quiz["correct_word"],
+            "original_sentence": quiz["original_sentence"],
+            "options": list(quiz["options"]),
+            "correct_index": quiz["correct_index"],
+        })
+        return quiz_id
+
+    async def get(self, quiz_id):
+        quiz = self.instances.get(quiz_id)
+        if quiz is not None:
+            self.instances.move_to_end(quiz_id)
+            return quiz
+        quiz = await self.db.get_quiz_instance(quiz_id)
+        if quiz is not None:
+            self._remember(quiz)
+        return quiz
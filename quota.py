@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from configuration import MAX_REQUESTS_PER_DAY, QUOTA_BACKEND
+
+
+class SQLiteQuotaBackend:
+    """Счётчики запросов в SQLite — общие для всех процессов бота"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def consume(self, user_id, day, limit):
+        return await self.db.consume_request_quota(user_id, day, limit)
+
+    async def get(self, user_id, day):
+        return await self.db.get_request_count(user_id, day)
+
+    async def purge(self, before_day):
+        await self.db.purge_request_quota(before_day)
+
+
+class MemoryQuotaBackend:
+    """Локальная замена SQLite-счётчиков для одного процесса"""
+
+    def __init__(self):
+        self.counters = {}
+
+    async def consume(self, user_id, day, limit):
+        count = self.counters.get((user_id, day), 0)
+        if count >= limit:
+            return False, count
+        self.counters[(user_id, day)] = count + 1
+        return True, count + 1
+
+    async def get(self, user_id, day):
+        return self.counters.get((user_id, day), 0)
+
+    async def purge(self, before_day):
+        self.counters = {key: count for key, count in self.counters.items() if key[1] >= before_day}
+
+
+class QuotaStore:
+    """Дневной лимит запросов к ИИ.
+
+    Проверка и увеличение счётчика выполняются одним атомарным запросом
+    к хранилищу. В памяти хранятся последние известные значения счётчиков
+    за текущий день: по ним показывается остаток, а пользователям с
+    исчерпанным лимитом отказ выдаётся без обращения к базе (за день
+    счётчик может только расти, так что это верно и при нескольких процессах).
+    Счётчики за прошедшие дни удаляются при смене даты.
+    """
+
+    def __init__(self, backend, limit=MAX_REQUESTS_PER_DAY):
+        self.backend = backend
+        self.limit = limit
+        self.day = None
+        self.counters = {}
+
+    async def _today(self):
+        today = datetime.now().date().isoformat()
+        if today != self.day:
+            self.day = today
+            self.counters = {}
+            await self.backend.purge(today)
+        return today
+
+    async def acquire(self, user_id):
+        """Засчитывает запрос; возвращает False, если лимит на сегодня исчерпан"""
+        today = await self._today()
+        if self.counters.get(user_id, 0) >= self.limit:
+            return False
+        allowed, count = await self.backend.consume(user_id, today, self.limit)
+        self.counters[user_id] = count
+        return allowed
+
+    async def remaining(self, user_id):
+        today = await self._today()
+        if user_id not in self.counters:
+            self.counters[user_id] = await self.backend.get(user_id, today)
+        return max(self.limit - self.counters[user_id], 0)
+
+
+def create_quota_store(db):
+    if QUOTA_BACKEND == "memory":
+        return QuotaStore(MemoryQuotaBackend())
+    return QuotaStore(SQLiteQuotaBackend(db))
@@ -1,205 +1,300 @@
-import json
+import asyncio
 import random
 import sqlite3
-from aiogram import Dispatcher, Bot
-from aiogram.types import FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.client.default import DefaultBotProperties
+from datetime import date, datetime, timedelta
+
+import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
-from configuration import BOT_TOKEN
-
-bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
-dp = Dispatcher()
+from configuration import DATABASE_PATH, DEFAULT_TIMEZONE, DELIVERY_WINDOW_MINUTES, DELIVERY_CATCHUP_MINUTES
+from broadcast import broadcaster, is_permanent_error
+from content import content
+from db import AsyncDatabase, BatchWriter
+from distractors import distractors
+from journal import BroadcastJournal
+from outbound import bot, lane, BULK
+from photo_cache import PhotoCache
+from payloads import QuizPayload, WordPayload
+from quiz_store import QuizInstanceStore
+from srs import SpacedRepetition
+from word_rotation import WordRotation
 
-# Функция для подключения к базе данных
-def get_db_connection():
-    return sqlite3.connect("korean_bot.db")
+db = AsyncDatabase(DATABASE_PATH)
+photo_cache = PhotoCache(db)
+quiz_store = QuizInstanceStore(db)
+journal = BroadcastJournal(db)
+srs = SpacedRepetition(db)
+word_rotation = WordRotation(db)
 
-# Загружаем список слов из JSON-файла
-def load_words():
-    with open("words.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+BROADCAST_NAMES = {"quiz": "квиз", "word": "слово дня"}
 
-# Загружаем квизы из JSON-файла
-def load_quiz_data():
-    try:
-        with open("quiz_data.json", "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return data.get("quiz_questions", [])
-    except FileNotFoundError:
-        print("❌ Файл quiz_data.json не найден")
-        return []
-    except json.JSONDecodeError:
-        print("❌ Ошибка чтения quiz_data.json")
-        return []
-
-# Функция для создания квиза
-async def create_quiz_question():
-    quiz_data = load_quiz_data()
-    words = load_words()
+# Функция для создания квиза; item — слово, выбранное интервальным повторением
+async def create_quiz_question(item=None):
+    content.refresh()
     
-    if not quiz_data:
+    if not content.quizzes:
         # Fallback: создаем простой квиз из слов
-        return await create_fallback_quiz(words)
+        return await create_fallback_quiz(content.words, content.words_by_word.get(item))
     
-    # Выбираем случайный квиз из подготовленных данных
-    quiz_item = random.choice(quiz_data)
+    # Выбираем квиз по слову или случайный из подготовленных данных
+    quiz_item = random.choice(content.quizzes_by_word.get(item) or content.quizzes)
     
     # Создаем список вариантов и перемешиваем
-    options = [quiz_item["word"]] + quiz_item["wrong_options"]
+    options = [quiz_item.word, *quiz_item.wrong_options]
     random.shuffle(options)
     
     # Находим индекс правильного ответа
-    correct_index = options.index(quiz_item["word"])
+    correct_index = options.index(quiz_item.word)
     
     return {
-        "sentence": quiz_item["sentence"],
-        "original_sentence": quiz_item["original_sentence"],
+        "sentence": quiz_item.sentence,
+        "original_sentence": quiz_item.original_sentence,
         "options": options,
         "correct_index": correct_index,
-        "correct_word": quiz_item["word"],
-        "translation": quiz_item["translation"]
+        "correct_word": quiz_item.word,
+        "translation": quiz_item.translation
     }
 
 # Функция-запасной вариант если нет файла с квизами
-async def create_fallback_quiz(words):
-    correct_word_data = random.choice(words)
-    correct_word = correct_word_data["word"]
-    translation = correct_word_data["translation"]
-    
-    # Простое предложение-заготовка
-    sentence = f"나는 ______을(를) 좋아해요."
-    original_sentence = f"나는 {correct_word}을(를) 좋아해요."
-    
-    # Выбираем 3 неправильных варианта
-    wrong_words = []
-    while len(wrong_words) < 3:
-        wrong_word_data = random.choice(words)
-        if wrong_word_data["word"] != correct_word and wrong_word_data["word"] not in wrong_words:
-            wrong_words.append(wrong_word_data["word"])
-    
-    # Создаем список вариантов и перемешиваем
-    options = [correct_word] + wrong_words
-    random.shuffle(options)
-    correct_index = options.index(correct_word)
-    
-    return {
-        "sentence": sentence,
-        "original_sentence": original_sentence,
-        "options": options,
-        "correct_index": correct_index,
-        "correct_word": correct_word,
-        "translation": translation
-    }
+async def create_fallback_quiz(words, correct_word_data=None):
+    correct_word_data = correct_word_data or random.choice(words)
+    # Неправильные варианты — похожие слова из индекса, посчитанного при загрузке словаря
+    return distractors.get().quiz(correct_word_data)
 
-# Функция отправки квиза (остается без изменений)
-async def send_quiz():
-    print("🔄 Начало отправки квиза...")
-    
-    quiz = await create_quiz_question()
-    
-    # Получаем список всех пользователей из базы данных
+def make_job_id(kind, test_mode=False):
+    """id немедленной рассылки всем: одна в день (в тестовом режиме — в минуту)"""
+    return f"{kind}:{datetime.now():%Y-%m-%d %H:%M}" if test_mode else f"{kind}:{date.today()}"
+
+async def open_job(job_id, kind):
+    """Создает задание рассылки при первом обращении.
+
+    Квиз и слово подбираются каждому пользователю при отправке, поэтому
+    в задании хранится только признак персональной рассылки.
+    """
+    await journal.create(job_id, kind, {"personal": True})
+
+async def select_quizzes(user_ids):
+    """Слова квиза по интервальному повторению: {user_id: (слово, assignment)}"""
+    return {user_id: (assignment.item, assignment) for user_id, assignment in (await srs.select(user_ids)).items()}
+
+async def build_quiz(assignment):
+    quiz = await create_quiz_question(assignment.item)
+    # Квиз сохраняется один раз на слово, в кнопках — только его id и номер варианта
+    return QuizPayload(quiz, await quiz_store.create(quiz))
+
+async def select_words(user_ids):
+    """Слова дня без повторов: {user_id: (id слова, (слово, seen для записи))}"""
+    return {user_id: (word.id, (word, seen)) for user_id, (word, seen) in (await word_rotation.select(user_ids)).items()}
+
+async def build_word(choice):
+    return WordPayload(choice[0], photo_cache)
+
+class PersonalMessages:
+    """Сообщения рассылки, подобранные каждому пользователю.
+
+    select(user_ids) выбирает пачкой для всех получателей, взятых в работу,
+    пары (ключ, выбор); сообщение собирается build(выбор) один раз на ключ —
+    так каждый экземпляр квиза создаётся и каждое изображение загружается
+    в Telegram не больше одного раза за рассылку.
+    """
+
+    def __init__(self, select, build):
+        self.select = select
+        self.build = build
+        self.payloads = {}
+        self.assignments = {}
+
+    async def assign(self, user_ids):
+        for user_id, (key, choice) in (await self.select(user_ids)).items():
+            if key not in self.payloads:
+                self.payloads[key] = await self.build(choice)
+            self.assignments[user_id] = (key, choice)
+
+    def get(self, user_id):
+        """Возвращает (payload, выбор) или None, если для пользователя ничего не выбрано"""
+        assignment = self.assignments.get(user_id)
+        if assignment is None:
+            return None
+        key, choice = assignment
+        return self.payloads[key], choice
+
+    def forget(self, user_id):
+        self.assignments.pop(user_id, None)
+
+# Подбор сообщений по видам рассылки и текст ошибки, когда подбирать не из чего
+PERSONAL_MESSAGES = {
+    "quiz": (select_quizzes, build_quiz, "банк вопросов пуст"),
+    "word": (select_words, build_word, "словарь пуст"),
+}
+
+# Рассылки, которые уже идут в этом процессе
+running_jobs = set()
+
+async def run_broadcast(job_id, kind):
+    """Отправляет рассылку по журналу ещё не взятым в работу получателям"""
+    if job_id in running_jobs:
+        # Новых получателей заберет уже идущая рассылка
+        return
+    running_jobs.add(job_id)
+    # Запросы рассылки идут в полосе BULK и уступают ответам пользователям
+    lane_token = lane.set(BULK)
+    try:
+        select, build, empty_error = PERSONAL_MESSAGES[kind]
+        personal = PersonalMessages(select, build)
+
+        async def recipients():
+            async for user_ids in journal.recipient_batches(job_id):
+                await personal.assign(user_ids)
+                if kind == "quiz":
+                    # Активные квизы записываются до отправки, чтобы ответ пользователя не опередил запись
+                    rows = []
+                    for user_id in user_ids:
+                        chosen = personal.get(user_id)
+                        if chosen is not None:
+                            rows.append((user_id, chosen[0].quiz_id))
+                    await db.save_active_quizzes(rows)
+                for user_id in user_ids:
+                    yield user_id
+
+        async def deliver(user_id):
+            chosen = personal.get(user_id)
+            if chosen is None:
+                raise LookupError(empty_error)
+            payload, choice = chosen
+            await payload.send(bot, user_id)
+            personal.forget(user_id)
+            if kind == "word":
+                await seen_words.add((user_id, choice[1]))
+            elif choice.is_new:
+                await introduced.add((user_id, choice.item, date.today().isoformat(), choice.next_new))
+            await deliveries.add(("sent", job_id, user_id))
+
+        async def on_failure(user_id, error):
+            personal.forget(user_id)
+            if is_permanent_error(error):
+                # Бот заблокирован или аккаунт удален — больше не отправляем этому пользователю
+                await deliveries.add(("blocked", job_id, user_id))
+                await inactive_users.add(user_id)
+            else:
+                await deliveries.add(("failed", job_id, user_id))
+
+        summary = None
+        while summary is None:
+            async with journal.recorder() as deliveries, BatchWriter(db.deactivate_users) as inactive_users, \
+                    BatchWriter(db.introduce_review_items) as introduced, \
+                    BatchWriter(db.save_seen_words) as seen_words:
+                await broadcaster.run(BROADCAST_NAMES[kind], recipients(), deliver, on_failure)
+            # Пока шла отправка, могли добавиться получатели следующего слота
+            summary = await journal.finish(job_id)
+        print(
+            f"📊 Итог рассылки {job_id}: успешно отправлено {summary.get('sent', 0)}/{sum(summary.values())} "
+            f"пользователям, недоступны {summary.get('blocked', 0)}"
+        )
+    finally:
+        lane.reset(lane_token)
+        running_jobs.discard(job_id)
+
+async def send_now(kind, test_mode=False):
+    """Отправляет рассылку сразу всем активным пользователям"""
+    job_id = make_job_id(kind, test_mode)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users")
-        users = cursor.fetchall()
-        conn.close()
-        print(f"👥 Найдено пользователей: {len(users)}")
+        if await journal.get(job_id) is not None:
+            print(f"⏭ Рассылка {job_id} уже была, повторно не отправляем")
+            return
+        await open_job(job_id, kind)
+        count = await journal.enqueue(job_id)
     except sqlite3.Error as e:
-        print(f"❌ Ошибка при запросе пользователей: {e}")
+        print(f"❌ Ошибка при создании рассылки {job_id}: {e}")
         return
+    print(f"👥 Найдено пользователей: {count}")
+    await run_broadcast(job_id, kind)
+
+async def resume_broadcasts():
+    """Продолжает рассылки, прерванные перезапуском бота"""
+    for job_id, kind, _ in await journal.unfinished():
+        print(f"🔁 Продолжаем рассылку {job_id}")
+        await run_broadcast(job_id, kind)
+
+async def send_quiz(test_mode=False):
+    print("🔄 Начало отправки квиза...")
+    await send_now("quiz", test_mode)
 
-    # Отправляем квиз каждому пользователю
-    successful_sends = 0
-    for user in users:
-        user_id = user[0]
-        try:
-            # Создаем инлайн-кнопки с вариантами ответов
-            # Используем короткий формат callback_data без original_sentence
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text=option, 
-                    callback_data=f"quiz_{user_id}_{quiz['correct_index']}_{i}_{quiz['correct_word']}"
-                )]
-                for i, option in enumerate(quiz["options"])
-            ])
-            
-            message_text = (
-                f"<b>Ежедневный квиз</b>\n\n"
-                f"📝 <b>Заполните пропуск:</b>\n\n"
-                f"{quiz['sentence']}\n"
-                f"<i>({quiz['translation']})</i>"
-            )
-            
-            await bot.send_message(
-                chat_id=user_id,
-                text=message_text,
-                reply_markup=keyboard,
-                parse_mode="HTML"
-            )
-            
-            # Сохраняем original_sentence в базу данных
-            try:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT OR REPLACE INTO active_quizzes (user_id, correct_word, original_sentence)
-                    VALUES (?, ?, ?)
-                """, (user_id, quiz['correct_word'], quiz['original_sentence']))
-                conn.commit()
-                conn.close()
-            except Exception as e:
-                print(f"⚠️ Ошибка сохранения квиза в БД для {user_id}: {e}")
-            
-            successful_sends += 1
-            print(f"✅ Квиз отправлен пользователю {user_id}")
-        except Exception as e:
-            print(f"❌ Ошибка отправки квиза пользователю {user_id}: {e}")
-
-    print(f"📊 Итог: успешно отправлено {successful_sends}/{len(users)} пользователям")
-
-# Остальные функции остаются без изменений
 async def send_word():
-    words = load_words()
-    word_data = random.choice(words)
-    word, translation, image_path, example = (
-        word_data["word"],
-        word_data["translation"],
-        word_data["image"],
-        word_data.get("example", "Пример отсутствует."),
-    )
+    await send_now("word")
+
+# Ежедневные рассылки по местному времени пользователей: вид → (час, минута)
+daily_schedule = {}
+# Последний слот окна, уже добавленный в рассылку: (job_id, tz) → слот
+enqueued_slots = {}
+background_tasks = set()
 
+def get_timezone(name):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT user_id FROM users")
-        users = cursor.fetchall()
-        conn.close()
+        return pytz.timezone(name or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+async def delivery_tick():
+    """Раз в минуту добавляет в рассылки пользователей, у которых наступил их слот.
+
+    Пользователи каждого часового пояса делятся на DELIVERY_WINDOW_MINUTES
+    слотов по user_id, и слоты отправляются по одному в минуту после местного
+    времени рассылки — так нагрузка распределяется по окну, а не приходится
+    на одну секунду. Ещё DELIVERY_CATCHUP_MINUTES минут после окна досылаются
+    слоты, пропущенные из-за остановки бота: повторное добавление получателей
+    в журнал ничего не меняет, поэтому после перезапуска окно проходится заново.
+    """
+    now = datetime.now(pytz.utc)
+    slots = max(1, DELIVERY_WINDOW_MINUTES)
+    # Досылка пропущенных слотов не должна доходить до рассылки следующего дня
+    catchup = max(0, min(DELIVERY_CATCHUP_MINUTES, 24 * 60 - slots))
+    try:
+        timezones = await db.get_user_timezones()
     except sqlite3.Error as e:
-        print(f"Ошибка при запросе пользователей: {e}")
+        print(f"❌ Ошибка при запросе часовых поясов: {e}")
         return
+    for kind, (hour, minute) in daily_schedule.items():
+        for tz in timezones:
+            local = now.astimezone(get_timezone(tz))
+            # Окно может переходить через полночь — тогда рассылка относится к предыдущему дню
+            elapsed = (local.hour * 60 + local.minute - hour * 60 - minute) % (24 * 60)
+            job_id = f"{kind}:{(local - timedelta(minutes=elapsed)).date()}"
+            key = (job_id, tz)
+            if elapsed >= slots + catchup:
+                enqueued_slots.pop(key, None)
+                continue
+            # После окна добавляем слоты, пропущенные из-за остановки бота или пропущенного тика
+            slot = min(elapsed, slots - 1)
+            first_slot = enqueued_slots.get(key, -1) + 1
+            if first_slot > slot:
+                continue
+            try:
+                await open_job(job_id, kind)
+                added = await journal.enqueue(
+                    job_id, tz=tz, all_timezones=False, slots=slots, first_slot=first_slot, last_slot=slot
+                )
+            except sqlite3.Error as e:
+                print(f"❌ Ошибка при добавлении получателей в рассылку {job_id}: {e}")
+                continue
+            enqueued_slots[key] = slot
+            if added:
+                task = asyncio.create_task(run_broadcast(job_id, kind))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
 
-    for user in users:
-        user_id = user[0]
-        try:
-            photo = FSInputFile(image_path)
-            caption = (
-                f"<b>Слово дня:</b> {word}\n"
-                f"<b>Перевод:</b> {translation}\n"
-                f"✏️ <b>Пример:</b> {example}"
-            )
-            await bot.send_photo(chat_id=user_id, photo=photo, caption=caption, parse_mode="HTML")
-        except Exception as e:
-            print(f"Ошибка отправки фото пользователю {user_id}: {e}")
+def ensure_delivery_tick(scheduler):
+    if scheduler.get_job("delivery_tick") is None:
+        # Тик, запоздавший из-за занятого цикла событий, выполняется, а не пропускается
+        scheduler.add_job(delivery_tick, CronTrigger(second=0), id="delivery_tick",
+                          coalesce=True, misfire_grace_time=60)
 
 def schedule_daily_word(scheduler=None, hour=9, minute=0):
     if scheduler is None:
         scheduler = AsyncIOScheduler()
-    trigger = CronTrigger(hour=hour, minute=minute, second=0)
-    scheduler.add_job(send_word, trigger)
-    print(f"📅 Отправка слова дня в {hour:02d}:{minute:02d} каждый день")
+    daily_schedule["word"] = (hour, minute)
+    ensure_delivery_tick(scheduler)
+    print(f"📅 Отправка слова дня в {hour:02d}:{minute:02d} по времени пользователя (в течение {DELIVERY_WINDOW_MINUTES} мин)")
     return scheduler
 
 def schedule_daily_quiz(scheduler=None, test_mode=False, hour=19, minute=0):
@@ -208,10 +303,9 @@ def schedule_daily_quiz(scheduler=None, test_mode=False, hour=19, minute=0):
     if test_mode:
         trigger = IntervalTrigger(minutes=1)
         print("⚠️ ТЕСТОВЫЙ РЕЖИМ: отправка квиза каждую минуту")
+        scheduler.add_job(send_quiz, trigger, kwargs={"test_mode": test_mode})
     else:
-        trigger = CronTrigger(hour=hour, minute=minute, second=0)
-        print(f"📅 Отправка квиза в {hour:02d}:{minute:02d} каждый день")
-    
-    scheduler.add_job(send_quiz, trigger)
+        daily_schedule["quiz"] = (hour, minute)
+        ensure_delivery_tick(scheduler)
+        print(f"📅 Отправка квиза в {hour:02d}:{minute:02d} по времени пользователя (в течение {DELIVERY_WINDOW_MINUTES} мин)")
     return scheduler
-
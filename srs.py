@@ -0,0 +1,98 @@
+from collections import namedtuple
+from datetime import date, timedelta
+from math import gcd
+
+from content import content
+
+# Оценка ответа по шкале SM-2 (0–5, ниже 3 — слово не вспомнено)
+CORRECT_QUALITY = 4
+WRONG_QUALITY = 1
+
+# Слово, выбранное пользователю; next_new — позиция следующего нового слова после отправки
+Assignment = namedtuple("Assignment", "item is_new next_new")
+
+
+def sm2(easiness, interval, repetitions, quality):
+    """Один шаг алгоритма SM-2: возвращает новые (easiness, interval, repetitions)"""
+    if quality < 3:
+        repetitions, interval = 0, 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * easiness)
+    easiness = max(1.3, easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return easiness, interval, repetitions
+
+
+class SpacedRepetition:
+    """Выбор квиза для каждого пользователя по интервальному повторению.
+
+    Если срок повторения какого-то слова наступил, пользователь получает
+    самое просроченное. Иначе — следующее новое слово: у каждого пользователя
+    своя перестановка банка вопросов (a * k + b) mod N, поэтому её не нужно
+    хранить, достаточно позиции next_new. Когда новые слова закончились,
+    повторяется слово с ближайшим сроком.
+    """
+
+    def __init__(self, db, repository=content):
+        self.db = db
+        self.content = repository
+        self.source = None
+        self.items = []
+        self.known = set()
+        self.multipliers = []
+
+    def _refresh_items(self):
+        """Слова банка вопросов в стабильном порядке; пересчитываются при перезагрузке файлов"""
+        self.content.refresh()
+        source = self.content.quizzes_by_word or self.content.words_by_word
+        if source is not self.source:
+            self.source = source
+            self.items = sorted(source)
+            self.known = set(self.items)
+            size = len(self.items)
+            # Множители, взаимно простые с N, дают перестановку без повторов
+            self.multipliers = [a for a in range(1, size + 1) if gcd(a, size) == 1] or [1]
+        return self.items
+
+    def new_item(self, user_id, position):
+        """Слово на позиции position в перестановке пользователя"""
+        size = len(self.items)
+        mixed = (user_id * 2654435761) & 0xFFFFFFFF
+        multiplier = self.multipliers[mixed % len(self.multipliers)]
+        return self.items[(multiplier * position + (mixed >> 8)) % size]
+
+    async def select(self, user_ids, today=None):
+        """Выбирает слово для каждого пользователя пачки: {user_id: Assignment}"""
+        items = self._refresh_items()
+        if not items:
+            return {}
+        today = (today or date.today()).isoformat()
+        candidates = await self.db.get_review_candidates(list(user_ids))
+        assignments = {}
+        for user_id in user_ids:
+            item, next_review, next_new = candidates.get(user_id, (None, None, 0))
+            if item in self.known and next_review <= today:
+                assignments[user_id] = Assignment(item, False, next_new)
+            elif next_new < len(items):
+                assignments[user_id] = Assignment(self.new_item(user_id, next_new), True, next_new + 1)
+            elif item in self.known:
+                assignments[user_id] = Assignment(item, False, next_new)
+            else:
+                assignments[user_id] = Assignment(self.new_item(user_id, 0), False, next_new)
+        return assignments
+
+    async def record_answer(self, user_id, item, is_correct, today=None):
+        """Обновляет состояние слова после ответа; возвращает новое состояние"""
+        quality = CORRECT_QUALITY if is_correct else WRONG_QUALITY
+        today = today or date.today()
+
+        def review(easiness, interval, repetitions):
+            easiness, interval, repetitions = sm2(easiness, interval, repetitions, quality)
+            return easiness, interval, repetitions, (today + timedelta(days=interval)).isoformat()
+
+        return await self.db.record_review(user_id, item, review)
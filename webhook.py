@@ -0,0 +1,143 @@
+"""Запуск бота через webhook вместо long polling.
+
+Главный процесс открывает порт, регистрирует webhook в Telegram и запускает
+несколько рабочих процессов, которые принимают обновления на общем сокете.
+Планировщик рассылок работает только в первом рабочем процессе.
+
+    python webhook.py --workers 4
+    python webhook.py --workers 4 --skip-set-webhook   # локально, без регистрации в Telegram
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+import socket
+
+from aiohttp import web
+from aiogram import Bot
+
+from configuration import (
+    BOT_TOKEN,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_WORKERS,
+    WEBHOOK_DRAIN_TIMEOUT,
+    METRICS_HOST,
+    METRICS_PORT,
+)
+from outbound import create_session
+
+
+def create_app(with_scheduler, metrics_port=0):
+    # Модули бота импортируются уже в рабочем процессе: потоки и соединения
+    # с базой нельзя переносить через fork
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+    from Telegram_Korean import bot, dp, start_scheduler
+    from metrics import start_metrics_server
+
+    app = web.Application()
+    handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None)
+
+    async def drain(app):
+        # Дожидаемся обновлений, принятых до остановки, прежде чем закрыть сессию бота
+        tasks = handler._background_feed_update_tasks
+        if tasks:
+            logging.info(f"⏳ Завершаем обработку {len(tasks)} обновлений...")
+            await asyncio.wait(set(tasks), timeout=WEBHOOK_DRAIN_TIMEOUT)
+
+    app.on_shutdown.append(drain)
+    handler.register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    if with_scheduler:
+        async def on_startup(app):
+            start_scheduler()
+
+        app.on_startup.append(on_startup)
+    if metrics_port:
+        async def metrics_server(app):
+            runner = await start_metrics_server(METRICS_HOST, metrics_port)
+            yield
+            if runner is not None:
+                await runner.cleanup()
+
+        app.cleanup_ctx.append(metrics_server)
+    return app
+
+
+async def serve(app, sock):
+    runner = web.AppRunner(app, handle_signals=False, shutdown_timeout=WEBHOOK_DRAIN_TIMEOUT)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    # Сайт перестаёт принимать соединения, затем ждём уже принятые обновления
+    await runner.cleanup()
+
+
+def run_worker(index, sock):
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s")
+    # У каждого процесса свои метрики, поэтому и свой порт
+    metrics_port = METRICS_PORT + index if METRICS_PORT else 0
+    asyncio.run(serve(create_app(with_scheduler=index == 0, metrics_port=metrics_port), sock))
+
+
+async def set_webhook():
+    bot = Bot(token=BOT_TOKEN, session=create_session())
+    try:
+        await bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=["message", "callback_query"],
+        )
+    finally:
+        await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запуск бота в режиме webhook")
+    parser.add_argument("--workers", type=int, default=WEBHOOK_WORKERS)
+    parser.add_argument("--host", default=WEBHOOK_HOST)
+    parser.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    parser.add_argument("--skip-set-webhook", action="store_true", help="не регистрировать webhook в Telegram")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    if not args.skip_set_webhook:
+        if not WEBHOOK_URL:
+            parser.error("укажите WEBHOOK_URL в .env или запустите с --skip-set-webhook")
+        asyncio.run(set_webhook())
+
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=run_worker, args=(i, sock)) for i in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    print(f"Бот запущен (webhook): {args.host}:{args.port}{WEBHOOK_PATH}, процессов: {args.workers}")
+
+    def stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import random
+
+from content import content
+
+
+def lowest_bit(value):
+    """Номер младшего установленного бита"""
+    return (value & -value).bit_length() - 1
+
+
+def pick_unseen(seen, valid, rng=random):
+    """Случайное ещё не отправленное слово: возвращает (позиция, новое множество seen).
+
+    valid — битовая маска позиций, на которых есть корректное слово.
+    Когда пройден весь словарь, начинается новый круг.
+    """
+    seen &= valid
+    unseen = ~seen & valid
+    if not unseen:
+        seen, unseen = 0, valid
+    # Первое непросмотренное слово после случайной позиции (по кругу)
+    start = rng.randrange(valid.bit_length())
+    rest = unseen >> start
+    position = start + lowest_bit(rest) if rest else lowest_bit(unseen)
+    return position, seen | (1 << position)
+
+
+class WordRotation:
+    """Слово дня каждому пользователю без повторов, пока не пройден весь словарь.
+
+    Отправленные слова хранятся в word_progress битовым множеством по
+    позиции слова в words.json, поэтому слова, добавленные в конец файла,
+    считаются новыми для всех, а пропущенные при загрузке записи не сдвигают
+    позиции остальных и никогда не выбираются. Слова выбираются пачкой для всех получателей,
+    взятых в работу: одно чтение из базы и битовые операции над целыми.
+    """
+
+    def __init__(self, db, repository=content):
+        self.db = db
+        self.content = repository
+        self.source = None
+        self.valid = 0
+
+    def _index(self):
+        self.content.refresh()
+        if self.content.words_by_id is not self.source:
+            self.source = self.content.words_by_id
+            self.valid = sum(1 << word_id for word_id in self.source)
+
+    async def select(self, user_ids, rng=random):
+        """Выбирает слово для каждого пользователя пачки: {user_id: (слово, seen для записи)}"""
+        self._index()
+        if not self.valid:
+            return {}
+        words_by_id, valid = self.source, self.valid
+        stored = await self.db.get_seen_words(list(user_ids))
+        width = (valid.bit_length() + 7) // 8
+        assignments = {}
+        for user_id in user_ids:
+            seen = int.from_bytes(stored.get(user_id, b""), "little")
+            position, seen = pick_unseen(seen, valid, rng)
+            assignments[user_id] = (words_by_id[position], seen.to_bytes(width, "little"))
+        return assignments